@@ -0,0 +1,32 @@
+"""
+Mesure le débit d'inférence pour plusieurs tailles de batch et nombres de
+threads et enregistre la meilleure configuration de cette machine et de ce
+modèle dans autotune.json, reprise ensuite automatiquement par DGCNNInference.
+"""
+
+import argparse
+
+import torch
+
+from models.backends import BACKENDS
+from utils.autotune import BATCH_SIZES, TUNING_FILE, autotune, thread_candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Autotuning de l\'inférence DGCNN (taille de batch, threads)')
+    parser.add_argument('--models', type=str, default='models/best_model.pth')
+    parser.add_argument('--backend', choices=BACKENDS, default='eager')
+    parser.add_argument('--points', type=int, default=20_000, help='taille du nuage synthétique mesuré')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(BATCH_SIZES))
+    parser.add_argument('--threads', type=int, nargs='+', default=None,
+                        help=f"nombres de threads testés (défaut : {' '.join(map(str, thread_candidates()))})")
+    parser.add_argument('--output', type=str, default=TUNING_FILE)
+    args = parser.parse_args()
+
+    device = 'cuda' if torch.cuda.is_available() and args.backend == 'eager' else 'cpu'
+    autotune(args.models, args.backend, device, num_points=args.points, batch_sizes=args.batch_sizes,
+             threads=args.threads, path=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+"""
+Performance benchmarks for the DGCNN pipeline.
+
+Each sub-command times one optimization against the path it replaces on
+synthetic data, so it can run on any machine without the LiDAR splits:
+
+    python benchmark.py per-point --points 500000
+    python benchmark.py patches --points 5000000
+    python benchmark.py knn --sizes 1000 4000 16000
+    python benchmark.py edge-conv --patch-size 1024
+    python benchmark.py static-graph --static-graph 1,2,3,4 --static-graph 3,4
+    python benchmark.py backends --points 500000
+    python benchmark.py loader --points 2000000 --workers 0 2 4
+    python benchmark.py ddp-scaling --procs 1 2 4 8
+    python benchmark.py inference-workers --points 2000000 --workers 1 2 4
+"""
+
+import argparse
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+
+from evaluate import parse_layers
+from export import export_onnx, export_torchscript
+from inference import DGCNNInference
+from models.backends import BACKENDS, artifact_path, load_backend
+from models.dgcnn import DGCNN, knn
+from utils.data_loader import PointCloudDataset, make_loader
+from utils.distributed import usable_cores
+from utils.patches import PatchSampler
+
+
+def build_model(model_path=None, num_classes=4, **kwargs):
+    """Load a trained model, or fall back to random weights with realistic BatchNorm stats."""
+    torch.manual_seed(0)
+    model = DGCNN(num_classes=num_classes, **kwargs)
+    if model_path:
+        model.load_state_dict(torch.load(model_path, map_location='cpu'))
+    else:
+        for module in model.modules():
+            if isinstance(module, (torch.nn.BatchNorm1d, torch.nn.BatchNorm2d)):
+                module.running_mean.normal_(0, 0.1)
+                module.running_var.uniform_(0.5, 2.0)
+    return model.eval()
+
+
+def synthetic_cloud(num_points, seed=0):
+    """Random cloud shaped like a preprocessed tile: normalized xyz, return number, number of returns."""
+    rng = np.random.default_rng(seed)
+    xyz = rng.random((num_points, 3))
+    nr = rng.integers(1, 5, num_points)
+    rn = np.minimum(rng.integers(1, 5, num_points), nr)
+    return np.column_stack((xyz, rn, nr)).astype(np.float32)
+
+
+def throughput(fn, points, batch_size):
+    """Classify `points` batch by batch like DGCNNInference.predict and return points/sec."""
+    start = time.perf_counter()
+    with torch.no_grad():
+        for i in range(0, len(points), batch_size):
+            fn(points[i:i + batch_size]).argmax(dim=1)
+    return len(points) / (time.perf_counter() - start)
+
+
+def isolated(target, *args):
+    """Run target(*args) in a fresh process so that its peak RSS can be measured."""
+    with mp.get_context('spawn').Pool(1) as pool:
+        return pool.apply(target, args)
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of the current process to its current RSS (Linux)."""
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def peak_rss():
+    """Peak resident memory of the current process since the last reset, in bytes (Linux)."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _knn_case(num_points, num_dims, k, chunk_size, threads):
+    torch.set_num_threads(threads)
+    x = torch.randn(1, num_dims, num_points, generator=torch.Generator().manual_seed(0))
+    reset_peak_rss()
+    base = peak_rss()
+    start = time.perf_counter()
+    knn(x, k, chunk_size)
+    return time.perf_counter() - start, peak_rss() - base
+
+
+def _forward_case(model_kwargs, batch_shape, repeats, threads):
+    torch.set_num_threads(threads)
+    model = build_model(**model_kwargs)
+    x = torch.rand(*batch_shape, generator=torch.Generator().manual_seed(0))
+    with torch.no_grad():
+        model(x)
+        reset_peak_rss()
+        base = peak_rss()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(x)
+    return (time.perf_counter() - start) / repeats, peak_rss() - base
+
+
+def bench_per_point(args):
+    """Graph-based forward vs. the collapsed per-point path."""
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    model = build_model(args.model)
+    points = torch.from_numpy(synthetic_cloud(args.points))
+
+    with torch.no_grad():
+        sample = points[:args.batch_size]
+        diff = (model(sample) - model.forward_per_point(sample)).abs().max().item()
+    print(f"Max |logit diff| on {len(sample)} points: {diff:.2e}")
+
+    graph_points = points[:args.graph_points or len(points)]
+    graph = throughput(model, graph_points, args.batch_size)
+    fast = throughput(model.forward_per_point, points, args.batch_size)
+
+    print(f"Threads: {torch.get_num_threads()} | batch size: {args.batch_size}")
+    print(f"  graph forward:     {graph:12,.0f} points/sec ({len(graph_points):,} points)")
+    print(f"  per-point forward: {fast:12,.0f} points/sec ({len(points):,} points)")
+    print(f"  speedup:           {fast / graph:12.1f}x")
+    print(f"  estimated time for {args.points:,} points: "
+          f"{args.points / graph:.1f}s -> {args.points / fast:.1f}s")
+
+
+def bench_patches(args):
+    """Patch-based inference: index build time, patch count and per-batch latency."""
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    model = build_model(args.model, knn_chunk_size=args.knn_chunk_size)
+    points = synthetic_cloud(args.points)
+
+    start = time.perf_counter()
+    sampler = PatchSampler(points[:, :2], patch_size=args.patch_size, overlap=args.overlap)
+    num_patches = len(sampler)
+    print(f"KD-tree + grid over {args.points:,} points: {time.perf_counter() - start:.2f}s "
+          f"({num_patches:,} grid patches of {sampler.patch_size} points)")
+
+    votes = np.zeros((len(points), 4), dtype=np.int32)
+    latencies = []
+    with torch.no_grad():
+        for n, idx in enumerate(sampler.batches(args.patches_per_batch)):
+            if n == args.max_batches:
+                break
+            start = time.perf_counter()
+            pred = model(torch.from_numpy(points[idx]).permute(0, 2, 1)).argmax(dim=1).numpy()
+            np.add.at(votes, (idx, pred), 1)
+            latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies)
+    patches_per_sec = args.patches_per_batch / latencies.mean()
+    print(f"Threads: {torch.get_num_threads()} | {args.patches_per_batch} patches per batch")
+    print(f"  batch latency p50/p95/max: {np.percentile(latencies, 50) * 1e3:.0f} / "
+          f"{np.percentile(latencies, 95) * 1e3:.0f} / {latencies.max() * 1e3:.0f} ms")
+    print(f"  throughput: {patches_per_sec * sampler.patch_size:,.0f} patch points/sec, "
+          f"{patches_per_sec * sampler.patch_size / args.overlap:,.0f} cloud points/sec")
+    print(f"  estimated time for the grid pass: {num_patches / patches_per_sec:.0f}s")
+
+
+def bench_knn(args):
+    """Dense vs. blocked kNN: latency, peak memory and index agreement."""
+    threads = args.threads or torch.get_num_threads()
+    print(f"Threads: {threads} | k = {args.k} | {args.dims} dims | chunk = {args.chunk_size}")
+    print(f"{'N':>7} {'dense':>10} {'blocked':>10} {'dense peak':>12} {'blocked peak':>13} {'match':>7}")
+    for n in args.sizes:
+        dense_time, dense_mem = isolated(_knn_case, n, args.dims, args.k, None, threads)
+        blocked_time, blocked_mem = isolated(_knn_case, n, args.dims, args.k, args.chunk_size, threads)
+
+        x = torch.randn(1, args.dims, n, generator=torch.Generator().manual_seed(0))
+        match = (knn(x, args.k) == knn(x, args.k, args.chunk_size)).float().mean().item()
+        print(f"{n:>7,} {dense_time:>9.2f}s {blocked_time:>9.2f}s "
+              f"{dense_mem / 2 ** 20:>10.0f}MB {blocked_mem / 2 ** 20:>11.0f}MB {match:>7.2%}")
+
+
+def bench_edge_conv(args):
+    """Graph-feature EdgeConv vs. the lean projection/gather EdgeConv on patches."""
+    threads = args.threads or torch.get_num_threads()
+    shape = (args.patches_per_batch, 5, args.patch_size)
+    dense = build_model(args.model)
+    lean = build_model(args.model, lean_edge_conv=True)
+    x = torch.rand(*shape)
+    with torch.no_grad():
+        diff = (dense(x) - lean(x)).abs().max().item()
+
+    print(f"Threads: {threads} | batch of {args.patches_per_batch} patches x {args.patch_size} points")
+    print(f"Max |logit diff|: {diff:.2e}")
+    for name, kwargs in (('graph feature', {}), ('lean', {'lean_edge_conv': True})):
+        kwargs = dict(kwargs, model_path=args.model, knn_chunk_size=args.knn_chunk_size)
+        seconds, peak = isolated(_forward_case, kwargs, shape, args.repeats, threads)
+        print(f"  {name:<14} {seconds * 1e3:8.0f} ms/batch   peak +{peak / 2 ** 20:6.0f}MB")
+
+
+def bench_static_graph(args):
+    """Dynamic kNN before every EdgeConv vs. one xyz graph reused across layers."""
+    threads = args.threads or torch.get_num_threads()
+    shape = (args.patches_per_batch, 5, args.patch_size)
+    x = torch.rand(*shape)
+    with torch.no_grad():
+        reference = build_model(args.model, lean_edge_conv=args.lean_edge_conv)(x).argmax(dim=1)
+
+    print(f"Threads: {threads} | batch of {args.patches_per_batch} patches x {args.patch_size} points")
+    print(f"{'Variant':<16} {'ms/batch':>9} {'speedup':>8} {'agreement':>10}")
+    reference_time = None
+    for static_graph in [None] + (args.static_graph or [(1, 2, 3, 4)]):
+        kwargs = {'model_path': args.model, 'lean_edge_conv': args.lean_edge_conv,
+                  'knn_chunk_size': args.knn_chunk_size, 'static_graph': static_graph}
+        seconds, _ = isolated(_forward_case, kwargs, shape, args.repeats, threads)
+        reference_time = reference_time or seconds
+        with torch.no_grad():
+            agreement = (build_model(**kwargs)(x).argmax(dim=1) == reference).float().mean().item()
+
+        name = 'dynamic' if not static_graph else 'static ' + ','.join(map(str, static_graph))
+        print(f"{name:<16} {seconds * 1e3:>9.0f} {reference_time / seconds:>7.2f}x {agreement:>10.2%}")
+    print("Accuracy on the test split: python evaluate.py --static-graph 1,2,3,4 --static-graph 3,4")
+
+
+def bench_backends(args):
+    """Eager vs. TorchScript vs. ONNX Runtime on the per-point model (CPU)."""
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    points = torch.from_numpy(synthetic_cloud(args.points))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.pth')
+        model = build_model(args.model, per_point=True)
+        torch.save(model.state_dict(), model_path)
+        export_torchscript(model, artifact_path(model_path, 'torchscript'), points[:args.batch_size])
+        export_onnx(model, artifact_path(model_path, 'onnxruntime'), points[:args.batch_size])
+
+        with torch.no_grad():
+            reference = model(points[:1000])
+        print(f"Threads: {torch.get_num_threads()} | batch size: {args.batch_size} | {args.points:,} points")
+        for backend in BACKENDS:
+            fn = load_backend(model_path, backend)
+            with torch.no_grad():
+                diff = (fn(points[:1000]) - reference).abs().max().item()
+            speed = throughput(fn, points, args.batch_size)
+            print(f"  {backend:<12} {speed:12,.0f} points/sec   max |logit diff| {diff:.1e}")
+
+
+def _epoch_speed(loader, max_batches):
+    """Points/sec served by a loader over at most max_batches batches (first batch excluded: worker startup)."""
+    iterator = iter(loader)
+    next(iterator)
+    count, batches = 0, 0
+    start = time.perf_counter()
+    for features, _ in iterator:
+        count += len(features)
+        batches += 1
+        if batches == max_batches:
+            break
+    return count / (time.perf_counter() - start)
+
+
+def bench_loader(args):
+    """Per-sample __getitem__ + collate vs. one fancy index per batch (in memory and memory-mapped)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'train.npy')
+        labels = np.random.default_rng(1).integers(1, 5, args.points)
+        np.save(path, np.column_stack((synthetic_cloud(args.points), labels)).astype(np.float64))
+
+        in_memory = PointCloudDataset(path)
+        print(f"{args.points:,} points | batch size {args.batch_size} | up to {args.max_batches} batches")
+        print(f"{'Loader':<28} {'workers':>7} {'points/sec':>12}")
+        per_sample = torch.utils.data.DataLoader(in_memory, batch_size=args.batch_size, shuffle=True)
+        print(f"{'per-sample (previous)':<28} {0:>7} {_epoch_speed(per_sample, args.max_batches):>12,.0f}")
+
+        for name, dataset in (('batch, in memory', in_memory), ('batch, mmap', PointCloudDataset(path, mmap=True))):
+            for workers in args.workers:
+                loader = make_loader(dataset, args.batch_size, shuffle=True, num_workers=workers,
+                                     persistent_workers=True, prefetch_factor=args.prefetch_factor)
+                print(f"{name:<28} {workers:>7} {_epoch_speed(loader, args.max_batches):>12,.0f}")
+                del loader
+
+
+def _ddp_rank(rank, world_size, port, batch_size, steps, threads, results):
+    """One training process: DDP (gloo) steps on its own synthetic shard."""
+    os.environ.update({'MASTER_ADDR': '127.0.0.1', 'MASTER_PORT': str(port)})
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    torch.set_num_threads(threads)
+
+    torch.manual_seed(0)
+    model = DistributedDataParallel(DGCNN(num_classes=4).train())
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
+    points = torch.from_numpy(synthetic_cloud(batch_size * (steps + 2), seed=rank))
+    labels = torch.randint(0, 4, (len(points),))
+
+    def step(i):
+        batch = slice(i * batch_size, (i + 1) * batch_size)
+        optimizer.zero_grad(set_to_none=True)
+        torch.nn.functional.cross_entropy(model(points[batch]), labels[batch]).backward()
+        optimizer.step()
+
+    for i in range(2):  # warm-up
+        step(i)
+    dist.barrier()
+    start = time.perf_counter()
+    for i in range(2, steps + 2):
+        step(i)
+    dist.barrier()
+    if rank == 0:
+        results.put(time.perf_counter() - start)
+    dist.destroy_process_group()
+
+
+def bench_ddp_scaling(args):
+    """Data-parallel training throughput (gloo, CPU) for 1..N processes at a fixed batch size per process."""
+    ctx = mp.get_context('spawn')
+    cores = len(usable_cores())
+    print(f"{cores} cores | batch {args.batch_size} per process | {args.steps} steps")
+    print(f"{'processes':>9} {'threads':>8} {'samples/sec':>12} {'speedup':>8} {'efficiency':>10}")
+    reference = None
+    for world_size in args.procs:
+        threads = args.threads or max(1, cores // world_size)
+        results = ctx.Queue()
+        port = 29500 + world_size
+        procs = [ctx.Process(target=_ddp_rank,
+                             args=(rank, world_size, port, args.batch_size, args.steps, threads, results))
+                 for rank in range(world_size)]
+        for proc in procs:
+            proc.start()
+        # Attente des processus avant de lire : si un rang meurt (init gloo, OOM), les autres,
+        # bloqués dans une collective, sont arrêtés au lieu de bloquer le benchmark
+        alive = list(procs)
+        while alive:
+            mp.connection.wait([proc.sentinel for proc in alive])
+            alive = [proc for proc in alive if proc.is_alive()]
+            if any(proc.exitcode for proc in procs if not proc.is_alive()):
+                for proc in alive:
+                    proc.terminate()
+        for proc in procs:
+            proc.join()
+        failed = [rank for rank, proc in enumerate(procs) if proc.exitcode != 0]
+        if failed:
+            print(f"{world_size:>9} {threads:>8}  échec : rang(s) {failed} (codes {[procs[r].exitcode for r in failed]})")
+            continue
+        seconds = results.get(timeout=10)
+
+        speed = world_size * args.batch_size * args.steps / seconds
+        reference = reference or speed / world_size
+        print(f"{world_size:>9} {threads:>8} {speed:>12,.0f} {speed / reference:>7.2f}x "
+              f"{speed / (reference * world_size):>10.0%}")
+
+
+def bench_inference_workers(args):
+    """Single-process batch loop vs. sharded multi-process inference (wall time, pool start-up included)."""
+    cores = len(usable_cores())
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.pth')
+        torch.save(build_model(args.model, per_point=True).state_dict(), model_path)
+        cloud_path = os.path.join(tmp, 'cloud.npy')
+        np.save(cloud_path, synthetic_cloud(args.points))
+
+        inferencer = DGCNNInference(model_path)
+        print(f"{cores} cores | {args.points:,} points")
+        print(f"{'workers':>7} {'threads':>8} {'points/sec':>12} {'speedup':>8}")
+        reference, expected = None, None
+        for workers in args.workers:
+            threads = args.threads or max(1, cores // workers)
+            torch.set_num_threads(threads)
+            start = time.perf_counter()
+            classes = inferencer.predict(cloud_path, workers=workers, threads=threads)[:, 5]
+            speed = args.points / (time.perf_counter() - start)
+            reference = reference or speed
+            expected = classes if expected is None else expected
+            same = '' if np.array_equal(classes, expected) else '   (classes différentes !)'
+            print(f"{workers:>7} {threads:>8} {speed:>12,.0f} {speed / reference:>7.2f}x{same}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks DGCNN')
+    parser.add_argument('--model', type=str, default=None,
+                        help='state_dict à charger (défaut: poids aléatoires)')
+    parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    per_point = subparsers.add_parser('per-point', help=bench_per_point.__doc__)
+    per_point.add_argument('--points', type=int, default=500_000)
+    per_point.add_argument('--graph-points', type=int, default=20_000,
+                           help='points chronométrés sur le chemin graphe, lent (0 = tous)')
+    per_point.add_argument('--batch-size', type=int, default=128)
+    per_point.set_defaults(func=bench_per_point)
+
+    patches = subparsers.add_parser('patches', help=bench_patches.__doc__)
+    patches.add_argument('--points', type=int, default=5_000_000)
+    patches.add_argument('--patch-size', type=int, default=1024)
+    patches.add_argument('--overlap', type=float, default=2.0)
+    patches.add_argument('--patches-per-batch', type=int, default=8)
+    patches.add_argument('--knn-chunk-size', type=int, default=None,
+                         help='kNN par blocs (défaut: matrice de distances dense)')
+    patches.add_argument('--max-batches', type=int, default=20,
+                         help='batchs chronométrés (-1 = tous)')
+    patches.set_defaults(func=bench_patches)
+
+    knn_parser = subparsers.add_parser('knn', help=bench_knn.__doc__)
+    knn_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 4000, 16000])
+    knn_parser.add_argument('--dims', type=int, default=64)
+    knn_parser.add_argument('--k', type=int, default=20)
+    knn_parser.add_argument('--chunk-size', type=int, default=1024)
+    knn_parser.set_defaults(func=bench_knn)
+
+    edge_conv = subparsers.add_parser('edge-conv', help=bench_edge_conv.__doc__)
+    edge_conv.add_argument('--patch-size', type=int, default=1024)
+    edge_conv.add_argument('--patches-per-batch', type=int, default=8)
+    edge_conv.add_argument('--knn-chunk-size', type=int, default=None)
+    edge_conv.add_argument('--repeats', type=int, default=3)
+    edge_conv.set_defaults(func=bench_edge_conv)
+
+    static_graph = subparsers.add_parser('static-graph', help=bench_static_graph.__doc__)
+    static_graph.add_argument('--static-graph', type=parse_layers, action='append', metavar='COUCHES')
+    static_graph.add_argument('--patch-size', type=int, default=1024)
+    static_graph.add_argument('--patches-per-batch', type=int, default=8)
+    static_graph.add_argument('--knn-chunk-size', type=int, default=None)
+    static_graph.add_argument('--lean-edge-conv', action='store_true')
+    static_graph.add_argument('--repeats', type=int, default=3)
+    static_graph.set_defaults(func=bench_static_graph)
+
+    backends = subparsers.add_parser('backends', help=bench_backends.__doc__)
+    backends.add_argument('--points', type=int, default=500_000)
+    backends.add_argument('--batch-size', type=int, default=128)
+    backends.set_defaults(func=bench_backends)
+
+    loader = subparsers.add_parser('loader', help=bench_loader.__doc__)
+    loader.add_argument('--points', type=int, default=2_000_000)
+    loader.add_argument('--batch-size', type=int, default=128)
+    loader.add_argument('--workers', type=int, nargs='+', default=[0, 2])
+    loader.add_argument('--prefetch-factor', type=int, default=4)
+    loader.add_argument('--max-batches', type=int, default=2000)
+    loader.set_defaults(func=bench_loader)
+
+    ddp_scaling = subparsers.add_parser('ddp-scaling', help=bench_ddp_scaling.__doc__)
+    ddp_scaling.add_argument('--procs', type=int, nargs='+', default=[1, 2, 4, 8])
+    ddp_scaling.add_argument('--batch-size', type=int, default=128)
+    ddp_scaling.add_argument('--steps', type=int, default=10)
+    ddp_scaling.set_defaults(func=bench_ddp_scaling)
+
+    inference_workers = subparsers.add_parser('inference-workers', help=bench_inference_workers.__doc__)
+    inference_workers.add_argument('--points', type=int, default=2_000_000)
+    inference_workers.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    inference_workers.set_defaults(func=bench_inference_workers)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
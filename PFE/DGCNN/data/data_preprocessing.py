@@ -1,64 +1,128 @@
 """
 Data preprocessing pipeline for point cloud data1.
 Converts LAZ files to normalized numpy arrays with class remapping.
+
+The LAZ file is streamed with laspy's chunk iterator and every chunk is
+written straight into a preallocated memory-mapped .npy, so peak RAM only
+depends on the chunk size, not on the size of the tile.
+
+Normalization takes two passes: the first one fits the x, y, z bounds chunk
+by chunk, the second one applies them. The parameters are saved next to the
+output (inference_zone.norm.json) and can be reused with --normalizer so that
+another tile, or a cloud at inference time, is scaled like the training data.
 """
 
+import argparse
+import os
+import sys
+
 import laspy
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
-from collections import Counter
 
-def remap_classification(value, classes_cibles):
-    """Remap non-target classes to class 1 (Unclassified)."""
-    return value if value in classes_cibles else 1
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.normalization import MinMaxNormalizer, sidecar_path
 
 # Configuration
 input_file = "inference_zone.laz"
 output_file = "inference_zone.npy"
 target_classes = [1, 2, 3, 4, 5, 6]  # Classes to keep
+chunk_size = 1_000_000  # Points read per chunk
+
+
+def remap_table(classes_cibles):
+    """Lookup table remapping non-target classes to class 1 (Unclassified)."""
+    lut = np.ones(256, dtype=np.uint8)
+    lut[classes_cibles] = classes_cibles
+    return lut
+
+
+def xyz(points):
+    """Scaled coordinates of a laspy chunk as an (n, 3) float64 array."""
+    return np.column_stack([np.asarray(points[dim], dtype=np.float64) for dim in ('x', 'y', 'z')])
+
+
+def fit_normalizer(input_file, chunk_size=chunk_size):
+    """First pass: x, y, z bounds of the whole file, one chunk in memory at a time."""
+    normalizer = MinMaxNormalizer()
+    with laspy.open(input_file) as reader:
+        for points in reader.chunk_iterator(chunk_size):
+            normalizer.partial_fit(xyz(points))
+    return normalizer
+
+
+def preprocess(input_file, output_file, target_classes, chunk_size=chunk_size, normalizer=None):
+    """
+    Stream a LAZ file into an (N, 6) .npy: normalized x, y, z, return_number,
+    number_of_returns, remapped classification.
+
+    Args:
+        normalizer: Fitted MinMaxNormalizer to apply; fitted on this file
+            (extra streaming pass) when None
+
+    Returns:
+        Class counts after remapping (index = class id)
+    """
+    lut = remap_table(target_classes)
+    class_counts = np.zeros(256, dtype=np.int64)
+
+    if normalizer is None:
+        print(" Pass 1/2: fitting x, y, z bounds")
+        normalizer = fit_normalizer(input_file, chunk_size)
+    normalizer.save(sidecar_path(output_file))
+
+    with laspy.open(input_file) as reader:
+        num_points = reader.header.point_count
+        print(f" {num_points:,} points, reading by chunks of {chunk_size:,}")
+
+        data = np.lib.format.open_memmap(output_file, mode='w+', dtype=np.float64, shape=(num_points, 6))
+        start = 0
+        for points in reader.chunk_iterator(chunk_size):
+            end = start + len(points)
+            normalizer.transform(xyz(points), out=data[start:end, :3])
+            data[start:end, 3] = points.return_number
+            data[start:end, 4] = points.number_of_returns
+
+            cls_remapped = lut[np.asarray(points.classification)]
+            data[start:end, 5] = cls_remapped
+            class_counts += np.bincount(cls_remapped, minlength=256)
+
+            start = end
+            print(f"  - {end:,} / {num_points:,} points")
+
+        data.flush()
+
+    # Display sample data1
+    print("\n Sample of processed data1 (first 5 points):")
+    print(data[:5])
+    del data
+
+    return class_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prétraitement LAZ -> .npy (x, y, z normalisés, retours, classe)')
+    parser.add_argument('--input', default=input_file)
+    parser.add_argument('--output', default=output_file)
+    parser.add_argument('--classes', type=int, nargs='+', default=target_classes, help='Classes to keep')
+    parser.add_argument('--chunk-size', type=int, default=chunk_size)
+    parser.add_argument('--normalizer', default=None,
+                        help='Paramètres de normalisation à réutiliser (ex. data.norm.json du jeu d\'entraînement)')
+    args = parser.parse_args()
+
+    print(" Starting data1 preprocessing...")
+    print(f" Loading LAZ file: {args.input}")
+    normalizer = MinMaxNormalizer.load(args.normalizer) if args.normalizer else None
+    class_counts = preprocess(args.input, args.output, args.classes, args.chunk_size, normalizer)
+    print(f" Saved processed data1 to {args.output}")
+    print(f" Saved normalization parameters to {sidecar_path(args.output)}")
+
+    # Display class distribution
+    print("\n Class distribution after remapping:")
+    for cls in np.flatnonzero(class_counts):
+        print(f"  - Class {cls}: {class_counts[cls]:,} points")
+
+    print("\n Preprocessing completed successfully!")
+
 
-print(" Starting data1 preprocessing...")
-
-# Load LAZ file
-print(f" Loading LAZ file: {input_file}")
-las = laspy.read(input_file)
-
-# Extract attributes
-print(" Extracting point cloud attributes...")
-x = las.x
-y = las.y
-z = las.z
-rn = las.return_number
-nr = las.number_of_returns
-cls = las.classification
-
-# Remap classes
-print(" Remapping classes...")
-vectorized_remap = np.vectorize(lambda x: remap_classification(x, target_classes))
-cls_remapped = vectorized_remap(cls)
-
-# Normalize coordinates
-print(" Normalizing coordinates...")
-scaler = MinMaxScaler()
-xyz = np.column_stack((x, y, z))
-xyz_normalized = scaler.fit_transform(xyz)
-
-# Combine features
-print(" Combining features...")
-data = np.column_stack((xyz_normalized, rn, nr, cls_remapped))
-
-# Save processed data1
-print(f" Saving processed data1 to {output_file}")
-np.save(output_file, data)
-
-# Display sample data1
-print("\n Sample of processed data1 (first 5 points):")
-print(data[:5])
-
-# Display class distribution
-class_counts = Counter(cls_remapped)
-print("\n Class distribution after remapping:")
-for cls, count in sorted(class_counts.items()):
-    print(f"  - Class {cls}: {count:,} points")
-
-print("\n Preprocessing completed successfully!")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,22 @@
 """
 Data splitting utility.
 Divides dataset into train/val/test sets with 70%/15%/15% split.
+
+The input is memory-mapped and read by chunks; every split is written
+incrementally into a preallocated memory-mapped .npy, so memory stays bounded
+by the chunk size (plus one byte per point for the random assignment).
+
+Two assignment modes:
+    random: seeded permutation of the split labels, exact 70/15/15 sizes
+    tiles:  XY grid of tile_size (normalized units); each tile is assigned as a
+            whole from a seeded hash of its id, so neighboring points stay in
+            the same split and evaluation is not inflated by spatial leakage
+            (sizes are then approximate)
 """
 
+import argparse
+import os
+
 import numpy as np
 
 # Configuration
@@ -12,39 +26,111 @@ output_files = {
     'val': "val.npy",
     'test': "test.npy"
 }
+ratios = (0.7, 0.15, 0.15)
+seed = 42  # For reproducibility
+chunk_size = 1_000_000  # Rows read per chunk
+
+
+def random_assignment(n_total, ratios, seed):
+    """Split id (0, 1, 2) of every row: exact sizes, uint8 to keep one byte per point."""
+    n_train = int(ratios[0] * n_total)
+    n_val = int(ratios[1] * n_total)
+    assignment = np.full(n_total, 2, dtype=np.uint8)
+    assignment[:n_train] = 0
+    assignment[n_train:n_train + n_val] = 1
+    np.random.default_rng(seed).shuffle(assignment)
+    return assignment
+
+
+def tile_assignment(xy, tile_size, ratios, seed):
+    """Split id of every row of a chunk from the seeded hash of its XY tile."""
+    tiles = np.floor(xy / tile_size).astype(np.int64)
+    key = (tiles[:, 0] * np.int64(0x9E3779B1) + tiles[:, 1]).astype(np.uint64) + np.uint64(seed)
+
+    # splitmix64 finalizer: uniform in [0, 1) and identical for every point of a tile
+    with np.errstate(over='ignore'):
+        key = key + np.uint64(0x9E3779B97F4A7C15)
+        key = (key ^ (key >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        key = (key ^ (key >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        key = key ^ (key >> np.uint64(31))
+    uniform = (key >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+    return np.searchsorted(np.cumsum(ratios[:2]), uniform, side='right').astype(np.uint8)
+
+
+def split(input_file, output_files, ratios=ratios, seed=seed, tile_size=None, chunk_size=chunk_size):
+    """
+    Stream input_file into the train/val/test files of output_files.
+
+    Args:
+        tile_size: Side of the XY tiles kept together (tiles mode); random
+            row assignment when None
+
+    Returns:
+        Number of rows written per split
+    """
+    data = np.load(input_file, mmap_mode='r')
+    n_total = data.shape[0]
+    names = list(output_files)
+
+    assignment = random_assignment(n_total, ratios, seed) if tile_size is None else None
+
+    def chunk_assignment(start, chunk):
+        if assignment is not None:
+            return assignment[start:start + len(chunk)]
+        return tile_assignment(chunk[:, :2], tile_size, ratios, seed)
+
+    # Pass 1: split sizes, to preallocate the outputs
+    sizes = np.zeros(len(names), dtype=np.int64)
+    for start in range(0, n_total, chunk_size):
+        chunk = data[start:start + chunk_size]
+        sizes += np.bincount(chunk_assignment(start, chunk), minlength=len(names))
+
+    # Pass 2: copy every chunk into the outputs
+    outputs = [np.lib.format.open_memmap(output_files[name], mode='w+', dtype=data.dtype,
+                                         shape=(int(size),) + data.shape[1:])
+               for name, size in zip(names, sizes)]
+    cursors = np.zeros(len(names), dtype=np.int64)
+    for start in range(0, n_total, chunk_size):
+        chunk = np.asarray(data[start:start + chunk_size])
+        labels = chunk_assignment(start, chunk)
+        for i, output in enumerate(outputs):
+            rows = chunk[labels == i]
+            output[cursors[i]:cursors[i] + len(rows)] = rows
+            cursors[i] += len(rows)
+
+    for output in outputs:
+        output.flush()
+    return dict(zip(names, sizes.tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Découpage train/val/test hors mémoire')
+    parser.add_argument('--input', default=input_file)
+    parser.add_argument('--output-dir', default='.', help='Dossier de train.npy, val.npy et test.npy')
+    parser.add_argument('--ratios', type=float, nargs=3, default=ratios, metavar=('TRAIN', 'VAL', 'TEST'))
+    parser.add_argument('--seed', type=int, default=seed)
+    parser.add_argument('--mode', choices=['random', 'tiles'], default='random',
+                        help='random : permutation des points ; tiles : tuiles XY entières par split')
+    parser.add_argument('--tile-size', type=float, default=0.05,
+                        help='Côté des tuiles XY en coordonnées normalisées (mode tiles)')
+    parser.add_argument('--chunk-size', type=int, default=chunk_size)
+    args = parser.parse_args()
+
+    print(" Starting data1 splitting...")
+    print(f" Loading data1 from {args.input}")
+    paths = {name: os.path.join(args.output_dir, path) for name, path in output_files.items()}
+    tile_size = args.tile_size if args.mode == 'tiles' else None
+    sizes = split(args.input, paths, args.ratios, args.seed, tile_size, args.chunk_size)
+
+    n_total = sum(sizes.values())
+    print(f" Total points: {n_total:,}")
+    print("\n Split sizes:")
+    for name, size in sizes.items():
+        print(f"  - {name.capitalize() + ':':<6} {size:,} points ({size / n_total:.0%}) -> {paths[name]}")
+
+    print("\n Data splitting completed successfully!")
+
 
-print(" Starting data1 splitting...")
-
-# Load data1
-print(f" Loading data1 from {input_file}")
-data = np.load(input_file)
-print(f" Total points: {data.shape[0]:,}")
-
-# Shuffle data1
-print(" Shuffling data1...")
-np.random.seed(42)  # For reproducibility
-np.random.shuffle(data)
-
-# Calculate split sizes
-n_total = data.shape[0]
-n_train = int(0.7 * n_total)
-n_val = int(0.15 * n_total)
-n_test = n_total - n_train - n_val
-
-print("\n Split sizes:")
-print(f"  - Train: {n_train:,} points ({n_train/n_total:.0%})")
-print(f"  - Val:   {n_val:,} points ({n_val/n_total:.0%})")
-print(f"  - Test:  {n_test:,} points ({n_test/n_total:.0%})")
-
-# Split data1
-print("\n Splitting data1...")
-train_data = data[:n_train]
-val_data = data[n_train:n_train + n_val]
-test_data = data[n_train + n_val:]
-
-# Save splits
-for name, path in output_files.items():
-    print(f" Saving {name} set to {path}")
-    np.save(path, locals()[f"{name}_data"])
-
-print("\n Data splitting completed successfully!")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,117 @@
+import argparse
+import time
 import torch
 import numpy as np
-from utils.data_loader import get_loaders
+from utils.data_loader import get_loaders, loader_options
 from models.dgcnn import DGCNN
-from utils.metrics import compute_metrics
+from utils.metrics import ConfusionMatrix, compute_metrics
+from utils.patches import classify_patches
 import os
 
+
+def print_metrics(metrics):
+    print("\nEvaluation Metrics:")
+    print(f"Accuracy: {metrics['accuracy']:.4f}")
+    print(f"F1 Macro: {metrics['f1_macro']:.4f}")
+    print(f"F1 Weighted: {metrics['f1_weighted']:.4f}")
+    print("\nF1 by class:")
+    for i, f1 in enumerate(metrics['f1_by_class']):
+        print(f"Class {i+1}: {f1:.4f}")
+
+
 def evaluate_model(model, test_loader, device):
     model.eval()
-    all_preds, all_targets = [], []
+    confusion = ConfusionMatrix(model.fc3.out_features, device)
 
     with torch.no_grad():
         for data, target in test_loader:
             data, target = data.to(device), target.to(device)
             output = model(data)
-            all_preds.extend(output.argmax(1).cpu().numpy())
-            all_targets.extend(target.cpu().numpy())
+            confusion.update(output.argmax(1), target)
 
-    metrics = compute_metrics(all_targets, all_preds)
+    metrics = confusion.compute()
+    print_metrics(metrics)
+    return metrics
+
+
+def evaluate_patches(model, data, device, patch_size=1024, overlap=2.0):
+    """Per-point metrics of patch-based inference (kNN over real neighbors, votes merged)."""
+    model.eval()
+    preds = classify_patches(model, data[:, :5].astype(np.float32), model.fc3.out_features, device,
+                             patch_size=patch_size, overlap=overlap)
+    metrics = compute_metrics(data[:, 5].astype(int) - 1, preds, num_classes=model.fc3.out_features)
+    print_metrics(metrics)
+    return metrics
+
+
+def compare_static_graph(state_dict, data, device, variants, patch_size=1024, overlap=2.0, **model_kwargs):
+    """
+    Evaluate the same weights with a dynamic graph and with each static-graph
+    variant, to weigh the speedup against the accuracy lost.
+
+    Args:
+        variants: Layer subsets reusing the xyz kNN graph, e.g. [(1, 2, 3, 4), (3, 4)]
+    """
+    results = []
+    for static_graph in [None] + list(variants):
+        name = 'dynamic' if not static_graph else 'static ' + ','.join(map(str, static_graph))
+        print(f"\n=== {name} ===")
+        model = DGCNN(num_classes=4, static_graph=static_graph, **model_kwargs).to(device)
+        model.load_state_dict(state_dict)
+
+        start = time.perf_counter()
+        metrics = evaluate_patches(model, data, device, patch_size=patch_size, overlap=overlap)
+        results.append((name, metrics, time.perf_counter() - start))
+
+    print(f"\n{'Variant':<16} {'Accuracy':>9} {'F1 Macro':>9} {'F1 Weighted':>12} {'Time':>8} {'Speedup':>8}")
+    reference_time = results[0][2]
+    for name, metrics, seconds in results:
+        print(f"{name:<16} {metrics['accuracy']:>9.4f} {metrics['f1_macro']:>9.4f} "
+              f"{metrics['f1_weighted']:>12.4f} {seconds:>7.1f}s {reference_time / seconds:>7.2f}x")
+    return results
+
+
+def parse_layers(spec):
+    """'1,2,3,4' -> (1, 2, 3, 4)"""
+    layers = tuple(int(layer) for layer in spec.split(','))
+    if not set(layers) <= {1, 2, 3, 4}:
+        raise argparse.ArgumentTypeError(f"couches EdgeConv invalides : {spec}")
+    return layers
 
-    print("\nEvaluation Metrics:")
-    print(f"Accuracy: {metrics['accuracy']:.4f}")
-    print(f"F1 Macro: {metrics['f1_macro']:.4f}")
-    print(f"F1 Weighted: {metrics['f1_weighted']:.4f}")
-    print("\nF1 by class:")
-    for i, f1 in enumerate(metrics['f1_by_class']):
-        print(f"Class {i+1}: {f1:.4f}")
 
 def main():
+    parser = argparse.ArgumentParser(description='Évaluation DGCNN sur le jeu de test')
+    parser.add_argument('--model', type=str, default='experiments/best_model.pth')
+    parser.add_argument('--mode', choices=['point', 'patch'], default='point',
+                        help='point : points isolés ; patch : patchs spatiaux avec vote')
+    parser.add_argument('--patch-size', type=int, default=1024)
+    parser.add_argument('--overlap', type=float, default=2.0)
+    parser.add_argument('--static-graph', type=parse_layers, action='append', metavar='COUCHES',
+                        help='compare le modèle dynamique à un graphe statique xyz sur ces couches '
+                             '(ex. 1,2,3,4 ; répétable, mode patch)')
+    parser.add_argument('--knn-chunk-size', type=int, default=None)
+    parser.add_argument('--lean-edge-conv', action='store_true')
+    args = parser.parse_args()
+
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     os.makedirs('experiments', exist_ok=True)
 
-    _, _, test_loader = get_loaders(batch_size=128)
-    model = DGCNN(num_classes=4).to(device)
+    model_kwargs = {'knn_chunk_size': args.knn_chunk_size, 'lean_edge_conv': args.lean_edge_conv}
+    state_dict = torch.load(args.model, map_location=device)
+
+    if args.static_graph:
+        compare_static_graph(state_dict, np.load("data/test.npy"), device, args.static_graph,
+                             patch_size=args.patch_size, overlap=args.overlap, **model_kwargs)
+        return
 
-    model_path = 'experiments/best_model.pth'
-    model.load_state_dict(torch.load(model_path, map_location=device))
+    model = DGCNN(num_classes=4, **model_kwargs).to(device)
+    model.load_state_dict(state_dict)
 
-    evaluate_model(model, test_loader, device)
+    if args.mode == 'patch':
+        evaluate_patches(model, np.load("data/test.npy"), device, patch_size=args.patch_size, overlap=args.overlap)
+    else:
+        _, _, test_loader = get_loaders(batch_size=128, **loader_options())
+        evaluate_model(model, test_loader, device)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
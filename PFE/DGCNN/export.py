@@ -0,0 +1,73 @@
+"""
+Export a trained DGCNN to TorchScript and ONNX for serving.
+The exported graph is the per-point forward (isolated points, no kNN graph)
+with a dynamic batch dimension:
+
+    python export.py --model experiments/best_model.pth
+"""
+
+import argparse
+
+import numpy as np
+import torch
+
+from models.backends import artifact_path, load_backend, load_eager
+
+
+def export_torchscript(model, path, example):
+    traced = torch.jit.trace(model, example)
+    traced.save(path)
+
+
+def export_onnx(model, path, example, opset=17):
+    torch.onnx.export(
+        model, (example,), path,
+        input_names=['points'],
+        output_names=['logits'],
+        dynamic_axes={'points': {0: 'batch_size'}, 'logits': {0: 'batch_size'}},
+        opset_version=opset,
+        dynamo=False)
+
+
+def check_parity(model_path, points, backends=('torchscript', 'onnxruntime'), atol=1e-4):
+    """Compare the logits of each exported backend with the eager model; True if all match."""
+    with torch.no_grad():
+        reference = load_eager(model_path, 'cpu')(points)
+
+    ok = True
+    for backend in backends:
+        with torch.no_grad():
+            logits = load_backend(model_path, backend)(points)
+        diff = (logits - reference).abs().max().item()
+        agreement = (logits.argmax(dim=1) == reference.argmax(dim=1)).float().mean().item()
+        ok &= diff <= atol
+        print(f"  {backend:<12} max |logit diff| {diff:.2e} | class agreement {agreement:.2%}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export DGCNN en TorchScript et ONNX')
+    parser.add_argument('--model', type=str, default='experiments/best_model.pth')
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--atol', type=float, default=1e-4, help='Écart maximal toléré sur les logits')
+    args = parser.parse_args()
+
+    model = load_eager(args.model, 'cpu')
+    example = torch.rand(128, 5)
+
+    ts_path = artifact_path(args.model, 'torchscript')
+    export_torchscript(model, ts_path, example)
+    print(f"TorchScript : {ts_path}")
+
+    onnx_path = artifact_path(args.model, 'onnxruntime')
+    export_onnx(model, onnx_path, example, opset=args.opset)
+    print(f"ONNX        : {onnx_path}")
+
+    print("\nParité avec le modèle eager (1000 points) :")
+    points = torch.from_numpy(np.random.default_rng(0).random((1000, 5), dtype=np.float32))
+    if not check_parity(args.model, points, atol=args.atol):
+        raise SystemExit(f"Écart supérieur à {args.atol} : artefacts à ne pas déployer")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,91 +1,81 @@
+import multiprocessing as mp
 import os
+import time
+from multiprocessing import shared_memory
 import numpy as np
 import torch
 import open3d as o3d
 from matplotlib import pyplot as plt
 from matplotlib.colors import ListedColormap
+from models.backends import BACKENDS, load_backend
+from utils.autotune import load_tuning, tune_once
+from utils.distributed import usable_cores
+from utils.normalization import MinMaxNormalizer
+from utils.patches import classify_patches
+
+PRECISIONS = {'fp32': torch.float32, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+
+_worker = None  # DGCNNInference d'un processus du pool (mode --workers)
+
+
+def _init_worker(model_path, backend, threads):
+    """Charge le modèle une seule fois par processus, avec un budget fixe de threads intra-op."""
+    global _worker
+    _worker = DGCNNInference(model_path, backend=backend, threads=threads)
+
+
+def _classify_shard(input_npy, start, stop, output, chunk_size, precision, normalizer):
+    """
+    Classe les points [start, stop) de l'entrée (memory-map) par chunks et
+    écrit les classes 1-based dans la sortie partagée : un segment de mémoire
+    partagée (nom) ou un .npy préalloué (chemin).
+    """
+    data = np.load(input_npy, mmap_mode='r')
+    shm = None
+    if output.endswith('.npy'):
+        classes = np.load(output, mmap_mode='r+')
+    else:
+        shm = shared_memory.SharedMemory(name=output)
+        classes = np.ndarray((len(data),), dtype=np.uint8, buffer=shm.buf)
+    for i in range(start, stop, chunk_size):
+        chunk = np.asarray(data[i:min(i + chunk_size, stop)])
+        classes[i:i + len(chunk)] = _worker._classify(_worker._features(chunk, normalizer), precision) + 1
+    if shm is None:
+        classes.flush()
+    else:
+        del classes
+        shm.close()
+    return stop - start
 
 
 class DGCNNInference:
-    def __init__(self, model_path):
+    def __init__(self, model_path, backend='eager', threads=None, tune=False):
+        """
+        Args:
+            threads: threads intra-op ; prioritaire sur la valeur mesurée par autotune.py
+            tune: lance l'autotuning si cette machine n'a pas encore de
+                configuration pour ce modèle (premier lancement) ; un seul
+                processus mesure à la fois, les autres relisent son résultat
+        """
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if backend != 'eager':
+            # Les artefacts exportés (TorchScript, ONNX) sont servis sur CPU
+            self.device = torch.device('cpu')
+
+        # Taille de batch et threads mesurés par autotune.py pour cette machine et ce modèle.
+        # Les threads sont fixés avant le chargement : ONNX Runtime les lit à la création de la session.
+        tuning = load_tuning(model_path, backend, self.device)
+        if tuning is None and tune:
+            tuning = tune_once(model_path, backend, self.device)
+        tuning = tuning or {}
+        self.batch_size = tuning.get('batch_size', 128)
+        threads = threads or tuning.get('threads')
+        if threads:
+            torch.set_num_threads(threads)
 
-        class DGCNN(torch.nn.Module):
-            def __init__(self, num_classes=4, k=20):
-                super().__init__()
-                self.k = k
-                self.conv1 = torch.nn.Sequential(
-                    torch.nn.Conv2d(5 * 2, 64, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm2d(64),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.conv2 = torch.nn.Sequential(
-                    torch.nn.Conv2d(64 * 2, 64, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm2d(64),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.conv3 = torch.nn.Sequential(
-                    torch.nn.Conv2d(64 * 2, 128, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm2d(128),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.conv4 = torch.nn.Sequential(
-                    torch.nn.Conv2d(128 * 2, 256, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm2d(256),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.conv5 = torch.nn.Sequential(
-                    torch.nn.Conv1d(256, 1024, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm1d(1024),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.fc1 = torch.nn.Linear(1024, 512)
-                self.fc2 = torch.nn.Linear(512, 256)
-                self.fc3 = torch.nn.Linear(256, num_classes)
-                self.dropout = torch.nn.Dropout(p=0.5)
-
-            def forward(self, x):
-                batch_size = x.size(0)
-                x = x.unsqueeze(1).permute(0, 2, 1)
-                x = self._edge_conv_blocks(x)
-                x = self._classification(x)
-                return x
-
-            def _edge_conv_blocks(self, x):
-                x1 = self._get_graph_feature(x)
-                x1 = self.conv1(x1).max(dim=-1, keepdim=False)[0]
-                x2 = self._get_graph_feature(x1)
-                x2 = self.conv2(x2).max(dim=-1, keepdim=False)[0]
-                x3 = self._get_graph_feature(x2)
-                x3 = self.conv3(x3).max(dim=-1, keepdim=False)[0]
-                x4 = self._get_graph_feature(x3)
-                x4 = self.conv4(x4).max(dim=-1, keepdim=False)[0]
-                x5 = self.conv5(x4).max(dim=-1, keepdim=False)[0]
-                return x5
-
-            def _get_graph_feature(self, x):
-                batch_size, num_dims, num_points = x.size()
-                if num_points == 1:
-                    x = x.repeat(1, 1, self.k)
-                    num_points = self.k
-                x_t = x.permute(0, 2, 1)
-                pairwise_distance = -torch.sum(x ** 2, dim=1, keepdim=True) - 2 * torch.matmul(x_t, x) - torch.sum(
-                    x ** 2, dim=1, keepdim=True).permute(0, 2, 1)
-                k = min(self.k, num_points - 1)
-                idx = pairwise_distance.topk(k=k + 1, dim=-1)[1][..., 1:]
-                idx_base = torch.arange(0, batch_size, device=x.device).view(-1, 1, 1) * num_points
-                idx = (idx + idx_base).view(-1)
-                x = x.permute(0, 2, 1).contiguous()
-                neighbors = x.view(batch_size * num_points, -1)[idx, :]
-                neighbors = neighbors.view(batch_size, num_points, k, num_dims)
-                x = x.view(batch_size, num_points, 1, num_dims).repeat(1, 1, k, 1)
-                return torch.cat((neighbors - x, x), dim=3).permute(0, 3, 1, 2)
-
-            def _classification(self, x):
-                x = torch.nn.functional.leaky_relu(self.fc1(x), negative_slope=0.2)
-                x = self.dropout(x)
-                x = torch.nn.functional.leaky_relu(self.fc2(x), negative_slope=0.2)
-                x = self.dropout(x)
-                return self.fc3(x)
-
-        self.model = DGCNN().to(self.device)
-        self.model.load_state_dict(torch.load(model_path, map_location=self.device))
-        self.model.eval()
+        self.backend = backend
+        self.model_path = model_path
+        self.model = load_backend(model_path, backend, self.device)
 
         self.colors = np.array([
             [1, 0, 0],  # Classe 1 - Unclassified (gris)
@@ -96,20 +86,167 @@ class DGCNNInference:
 
         self.class_names = ['Unclassified', 'Ground', 'Vegetation', 'Building']
 
-    def predict(self, input_npy):
+    def predict(self, input_npy, precision='fp32', normalizer=None, workers=1, threads=None):
+        """
+        Args:
+            precision: 'fp32', 'bf16' (autocast CPU/GPU) ou 'fp16' (GPU) ; en
+                précision réduite, le tampon d'entrée est lui aussi stocké dans
+                ce type, ce qui divise par deux la mémoire lue à chaque batch
+            normalizer: paramètres de normalisation du jeu d'entraînement
+                (MinMaxNormalizer ou chemin .norm.json) appliqués à x, y, z ;
+                le fichier d'entrée peut alors contenir les coordonnées brutes,
+                conservées telles quelles dans le résultat
+            workers: nombre de processus (voir _classify_sharded) ; 1 = boucle
+                de batchs dans le processus courant
+            threads: threads intra-op par processus (défaut : cœurs utilisables / workers)
+        """
         data = np.load(input_npy)
         assert data.shape[1] == 5, "Le fichier doit avoir exactement 5 colonnes"
-        points = torch.tensor(data, dtype=torch.float32).to(self.device)
+        if workers > 1:
+            classes = self._classify_sharded(input_npy, len(data), workers, threads, precision, normalizer)
+        else:
+            classes = self._classify(self._features(data, normalizer), precision) + 1
+        classified_data = np.column_stack((data, classes))
+        return classified_data
+
+    def predict_streaming(self, input_npy, output_npy, chunk_size=1_000_000, precision='fp32', normalizer=None,
+                          workers=1, threads=None):
+        """
+        Classification à mémoire bornée : l'entrée est lue par memory-map en
+        chunks de chunk_size points et les classes (1-based, uint8) sont
+        écrites au fur et à mesure dans output_npy, préalloué. La mémoire
+        utilisée dépend de chunk_size, pas de la taille du nuage. Avec
+        workers > 1, chaque processus écrit directement sa tranche dans output_npy.
+
+        Returns:
+            Memmap (N,) des classes prédites
+        """
+        data = np.load(input_npy, mmap_mode='r')
+        assert data.ndim == 2 and data.shape[1] == 5, "Le fichier doit avoir exactement 5 colonnes"
+        if isinstance(normalizer, str):
+            normalizer = MinMaxNormalizer.load(normalizer)
+
+        classes = np.lib.format.open_memmap(output_npy, mode='w+', dtype=np.uint8, shape=(len(data),))
+        if workers > 1:
+            classes.flush()
+            self._classify_sharded(input_npy, len(data), workers, threads, precision, normalizer,
+                                   output_npy=output_npy, chunk_size=chunk_size)
+            return classes
+        for start in range(0, len(data), chunk_size):
+            chunk = np.asarray(data[start:start + chunk_size])
+            classes[start:start + len(chunk)] = self._classify(self._features(chunk, normalizer), precision) + 1
+        classes.flush()
+        return classes
+
+    def _classify_sharded(self, input_npy, num_points, workers, threads=None, precision='fp32', normalizer=None,
+                          output_npy=None, chunk_size=1_000_000):
+        """
+        Classification multi-processus : la plage de points est découpée en
+        `workers` tranches contiguës, chaque processus (spawn) charge le modèle
+        une fois, lit sa tranche par memory-map et écrit ses classes dans une
+        sortie partagée, sans copie par pickle. Le budget de threads par
+        processus (défaut : cœurs utilisables / workers) évite de surcharger les
+        cœurs.
+
+        Returns:
+            Classes 1-based (uint8) si output_npy est None, sinon None (écrites dans output_npy)
+        """
+        threads = threads or max(1, len(usable_cores()) // workers)
+        if isinstance(normalizer, str):
+            normalizer = MinMaxNormalizer.load(normalizer)
+        bounds = np.linspace(0, num_points, workers + 1).astype(int)
+
+        shm = None
+        if output_npy is None:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, num_points))
+        output = output_npy or shm.name
+        try:
+            with mp.get_context('spawn').Pool(workers, initializer=_init_worker,
+                                              initargs=(self.model_path, self.backend, threads)) as pool:
+                pool.starmap(_classify_shard, [(input_npy, start, stop, output, chunk_size, precision, normalizer)
+                                               for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start])
+            if shm is not None:
+                return np.ndarray((num_points,), dtype=np.uint8, buffer=shm.buf).copy()
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    def class_counts(self, classes, chunk_size=10_000_000):
+        """Nombre de points par classe (index = classe 1-based) d'un tableau ou memmap de classes, par chunks."""
+        counts = np.zeros(len(self.class_names) + 1, dtype=np.int64)
+        for start in range(0, len(classes), chunk_size):
+            counts += np.bincount(classes[start:start + chunk_size], minlength=len(counts))
+        return counts
+
+    @staticmethod
+    def _features(data, normalizer=None):
+        """Entrées du modèle en float32, normalisées par chunks si des paramètres sont fournis."""
+        if normalizer is None:
+            return data
+        if isinstance(normalizer, str):
+            normalizer = MinMaxNormalizer.load(normalizer)
+        return normalizer.apply(data, out=np.empty(data.shape, dtype=np.float32))
+
+    def _classify(self, data, precision='fp32'):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Précision inconnue : {precision} (choix : {', '.join(PRECISIONS)})")
+        if precision != 'fp32' and self.backend != 'eager':
+            raise ValueError("La précision réduite nécessite le backend eager")
+        if precision == 'fp16' and self.device.type != 'cuda':
+            raise ValueError("fp16 nécessite un GPU (sur CPU : bf16)")
+        dtype = PRECISIONS[precision]
+        points = torch.tensor(data, dtype=dtype).to(self.device)
 
         predictions = []
-        batch_size = 128
-        with torch.no_grad():
+        batch_size = self.batch_size
+        with torch.no_grad(), torch.autocast(self.device.type, dtype=dtype, enabled=precision != 'fp32'):
             for i in range(0, len(points), batch_size):
                 batch = points[i:i + batch_size]
                 pred = self.model(batch)
                 predictions.append(pred.argmax(dim=1).cpu().numpy())
 
-        class_ids = np.concatenate(predictions)
+        return np.concatenate(predictions)
+
+    def precision_report(self, input_npy, precision='bf16', normalizer=None):
+        """Compare les classes prédites en précision réduite à celles du chemin fp32 sur un nuage de référence."""
+        data = np.load(input_npy)
+        assert data.shape[1] == 5, "Le fichier doit avoir exactement 5 colonnes"
+        data = self._features(data, normalizer)
+
+        timings = {}
+        for name in ('fp32', precision):
+            start = time.perf_counter()
+            timings[name] = (self._classify(data, name), time.perf_counter() - start)
+        reference, reduced = timings['fp32'][0], timings[precision][0]
+
+        agreement = (reference == reduced).mean()
+        print(f"\nParité {precision} / fp32 sur {len(data):,} points : {agreement:.4%} de classes identiques")
+        print(f"Temps : fp32 {timings['fp32'][1]:.2f}s | {precision} {timings[precision][1]:.2f}s")
+        per_class = {}
+        for cls, name in enumerate(self.class_names):
+            mask = reference == cls
+            if mask.any():
+                per_class[name] = (reduced[mask] == cls).mean()
+                print(f"  {name:<12} {mask.sum():>10,} points fp32 | {per_class[name]:.4%} identiques")
+        return {'agreement': agreement, 'per_class': per_class,
+                'fp32_seconds': timings['fp32'][1], 'reduced_seconds': timings[precision][1]}
+
+    def predict_patches(self, input_npy, patch_size=1024, overlap=2.0, patches_per_batch=8, normalizer=None):
+        """
+        Classification avec contexte spatial : le nuage est indexé une fois
+        (KD-tree XY) puis découpé en patchs de patch_size points qui se
+        chevauchent. Le graphe kNN du DGCNN voit alors de vrais voisins et les
+        prédictions des zones de recouvrement sont fusionnées par vote.
+        """
+        if self.backend != 'eager':
+            raise ValueError("Le mode patch nécessite le backend eager")
+        data = np.load(input_npy)
+        assert data.shape[1] == 5, "Le fichier doit avoir exactement 5 colonnes"
+        features = self._features(data, normalizer).astype(np.float32, copy=False)
+        class_ids = classify_patches(self.model, features, len(self.class_names), self.device,
+                                     patch_size=patch_size, overlap=overlap,
+                                     patches_per_batch=patches_per_batch)
         classified_data = np.column_stack((data, class_ids + 1))
         return classified_data
 
@@ -156,11 +293,56 @@ if __name__ == '__main__':
     parser.add_argument('input_file', type=str, help='Chemin vers le fichier .npy d\'entrée (5 colonnes)')
     parser.add_argument('--models', type=str, default='models/best_model.pth',
                         help='Chemin vers le modèle entraîné (default: models/best_model.pth)')
+    parser.add_argument('--mode', choices=['point', 'patch'], default='point',
+                        help='point : points isolés ; patch : patchs spatiaux avec vote (default: point)')
+    parser.add_argument('--patch-size', type=int, default=1024, help='Points par patch (mode patch)')
+    parser.add_argument('--overlap', type=float, default=2.0,
+                        help='Nombre moyen de patchs couvrant chaque point (mode patch)')
+
+    parser.add_argument('--backend', choices=BACKENDS, default='eager',
+                        help='eager, torchscript ou onnxruntime (artefacts produits par export.py)')
+
+    parser.add_argument('--precision', choices=list(PRECISIONS), default='fp32',
+                        help='fp32, bf16 (autocast CPU) ou fp16 (GPU) (default: fp32)')
+    parser.add_argument('--parity-report', action='store_true',
+                        help='Compare les classes prédites en --precision à celles du chemin fp32')
+    parser.add_argument('--stream', type=str, default=None, metavar='SORTIE.npy',
+                        help='mode mémoire bornée : entrée lue par chunks (mmap), classes écrites dans SORTIE.npy '
+                             '(pas de visualisation)')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='points par chunk (mode --stream)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processus d\'inférence, chacun sur une tranche du nuage (modes point et --stream)')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='threads intra-op par processus (défaut : cœurs utilisables / workers)')
+    parser.add_argument('--autotune', action='store_true',
+                        help='mesure la meilleure taille de batch / nombre de threads au premier lancement '
+                             'sur cette machine (voir autotune.py)')
+    parser.add_argument('--normalizer', type=str, default=None,
+                        help='Paramètres de normalisation du jeu d\'entraînement (.norm.json produit par '
+                             'data_preprocessing.py) à appliquer à un nuage non normalisé')
 
     args = parser.parse_args()
 
-    inferencer = DGCNNInference(args.model)
-    result = inferencer.predict(args.input_file)
+    inferencer = DGCNNInference(args.models, backend=args.backend,
+                                threads=args.threads if args.workers == 1 else None, tune=args.autotune)
+    if args.stream:
+        classes = inferencer.predict_streaming(args.input_file, args.stream, chunk_size=args.chunk_size,
+                                               precision=args.precision, normalizer=args.normalizer,
+                                               workers=args.workers, threads=args.threads)
+        counts = inferencer.class_counts(classes)
+        print(f"\nClasses écrites dans {args.stream}")
+        print("\nStatistiques de classification:")
+        for cls in np.flatnonzero(counts):
+            print(f"Classe {cls} ({inferencer.class_names[cls - 1]}): {counts[cls]} points ({counts[cls] / len(classes):.2%})")
+        raise SystemExit
+    if args.parity_report:
+        inferencer.precision_report(args.input_file, args.precision, normalizer=args.normalizer)
+    if args.mode == 'patch':
+        result = inferencer.predict_patches(args.input_file, patch_size=args.patch_size, overlap=args.overlap,
+                                            normalizer=args.normalizer)
+    else:
+        result = inferencer.predict(args.input_file, precision=args.precision, normalizer=args.normalizer,
+                                    workers=args.workers, threads=args.threads)
     inferencer.visualize(result, args.input_file)
 
     unique, counts = np.unique(result[:, 5], return_counts=True)
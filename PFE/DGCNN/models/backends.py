@@ -0,0 +1,71 @@
+"""
+Inference backends for the per-point DGCNN.
+The same trained state_dict can be served eagerly, as a TorchScript module or
+through ONNX Runtime; every backend maps a (batch_size, 5) float32 tensor of
+points to (batch_size, num_classes) logits.
+"""
+
+import os
+
+import torch
+
+from models.dgcnn import DGCNN
+
+BACKENDS = ('eager', 'torchscript', 'onnxruntime')
+ARTIFACT_EXTENSIONS = {'torchscript': '.pt', 'onnxruntime': '.onnx'}
+
+
+def artifact_path(model_path, backend):
+    """Exported artifact next to a checkpoint: best_model.pth -> best_model.pt / best_model.onnx."""
+    extension = ARTIFACT_EXTENSIONS.get(backend)
+    if extension is None or model_path.endswith(extension):
+        return model_path
+    return os.path.splitext(model_path)[0] + extension
+
+
+def load_eager(model_path, device, num_classes=4, **model_kwargs):
+    """Canonical DGCNN with the graph-free per-point path and lean EdgeConv enabled."""
+    model_kwargs = {'per_point': True, 'lean_edge_conv': True, **model_kwargs}
+    model = DGCNN(num_classes=num_classes, **model_kwargs).to(device)
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    return model.eval()
+
+
+class OnnxRuntimeModel:
+    """Callable wrapper giving an ONNX Runtime session the interface of a torch module."""
+
+    def __init__(self, onnx_path, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, points):
+        logits = self.session.run(None, {self.input_name: points.cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def load_backend(model_path, backend='eager', device='cpu', **model_kwargs):
+    """
+    Load a trained model for per-point inference.
+
+    Args:
+        model_path: Trained state_dict (.pth); TorchScript (.pt) and ONNX (.onnx)
+            artifacts are looked up next to it unless given directly
+        backend: 'eager', 'torchscript' or 'onnxruntime' (CPU)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend inconnu : {backend} (choix : {', '.join(BACKENDS)})")
+
+    if backend == 'eager':
+        return load_eager(model_path, device, **model_kwargs)
+
+    path = artifact_path(model_path, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} introuvable : lancer d'abord python export.py --model {model_path}")
+    if backend == 'torchscript':
+        return torch.jit.load(path, map_location=device).eval()
+    return OnnxRuntimeModel(path, num_threads=torch.get_num_threads())
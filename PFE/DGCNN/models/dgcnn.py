@@ -3,43 +3,170 @@ DGCNN (Dynamic Graph CNN) implementation for point cloud classification.
 Original paper: https://arxiv.org/abs/1801.07829
 """
 
+import copy
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
 
+def knn(x, k, chunk_size=None):
+    """
+    Indices of the k nearest neighbors of each point, excluding the point itself.
+
+    Args:
+        x: Point features of shape (batch_size, num_dims, num_points)
+        k: Number of neighbors
+        chunk_size: None for the dense (B, N, N) distance matrix, otherwise
+            the query/key tile size of the blocked search
+    Returns:
+        Indices of shape (batch_size, num_points, k), nearest first
+    """
+    if chunk_size is None or chunk_size >= x.size(2):
+        x_t = x.permute(0, 2, 1)
+        inner = -2 * torch.matmul(x_t, x)
+        xx = torch.sum(x ** 2, dim=1, keepdim=True)
+        pairwise_distance = -xx - inner - xx.permute(0, 2, 1)
+        return pairwise_distance.topk(k=k + 1, dim=-1)[1][..., 1:]
+
+    return knn_blocked(x, k, chunk_size)
+
+
+def knn_blocked(x, k, chunk_size):
+    """
+    Blocked kNN with a running top-k.
+
+    Distances are computed tile by tile over (query chunk, key chunk) pairs,
+    and each key tile is merged into the best k + 1 candidates found so far.
+    Peak memory is O(B * chunk * (k + chunk)) for the tiles plus the
+    O(B * N * k) result, instead of the O(B * N^2) dense matrix. Distances use
+    the same expression as the dense path, so the indices match up to ties.
+    """
+    num_points = x.size(2)
+    x_t = x.permute(0, 2, 1)
+    xx = torch.sum(x ** 2, dim=1, keepdim=True)
+
+    idx = []
+    for q in range(0, num_points, chunk_size):
+        query = x_t[:, q:q + chunk_size]
+        query_xx = xx[:, :, q:q + chunk_size].permute(0, 2, 1)
+        best_dist, best_idx = None, None
+
+        for c in range(0, num_points, chunk_size):
+            inner = -2 * torch.matmul(query, x[:, :, c:c + chunk_size])
+            dist = -xx[:, :, c:c + chunk_size] - inner - query_xx
+            cand = torch.arange(c, c + dist.size(2), device=x.device).expand_as(dist)
+            if best_dist is not None:
+                dist = torch.cat((best_dist, dist), dim=2)
+                cand = torch.cat((best_idx, cand), dim=2)
+            best_dist, pos = dist.topk(k=min(k + 1, dist.size(2)), dim=-1)
+            best_idx = cand.gather(2, pos)
+
+        idx.append(best_idx[..., 1:])
+
+    return torch.cat(idx, dim=1)
+
+
+def bn_affine(bn):
+    """Per-channel (scale, shift) of an eval-mode BatchNorm: bn(z) = z * scale + shift."""
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    return scale, bn.bias - bn.running_mean * scale
+
+
+class EdgeConv(nn.Sequential):
+    """
+    EdgeConv block: 1x1 Conv2d over [x_j - x_i, x_i] edge features, then
+    BatchNorm and LeakyReLU, max-pooled over the k neighbors by the caller.
+
+    Subclasses nn.Sequential so that state_dict keys (conv1.0.weight,
+    conv1.1.running_mean, ...) are those of the original model.
+    """
+
+    def __init__(self, in_channels, out_channels):
+        super(EdgeConv, self).__init__(
+            nn.Conv2d(in_channels * 2, out_channels, kernel_size=1, bias=False),
+            nn.BatchNorm2d(out_channels),
+            nn.LeakyReLU(negative_slope=0.2))
+
+    def forward_center(self, x):
+        """
+        Apply the block to [0, x] edge features without building them.
+
+        Args:
+            x: Point features of shape (batch_size, in_channels, num_points)
+        """
+        conv, bn, act = self
+        weight = conv.weight[:, x.size(1):]
+        return act(bn(F.conv2d(x.unsqueeze(-1), weight))).squeeze(-1)
+
+    def forward_lean(self, x, idx):
+        """
+        Eval-mode EdgeConv that never materializes a (B, C, N, k) tensor.
+
+        The conv is linear, so W [x_j - x_i, x_i] = W_d x_j + (W_c - W_d) x_i:
+        both terms are projected once per point and only the projections are
+        gathered. BatchNorm (eval) is a per-channel affine map and LeakyReLU is
+        increasing, so the max over neighbors commutes with both once channels
+        with a negative BatchNorm scale are sign-flipped. The neighbor max is a
+        running max over k gathers of shape (B * N, C_out).
+
+        Args:
+            x: Point features of shape (batch_size, in_channels, num_points)
+            idx: Neighbor indices of shape (batch_size, num_points, k) from knn()
+        Returns:
+            Features of shape (batch_size, out_channels, num_points)
+        """
+        conv, bn, act = self
+        batch_size, num_dims, num_points = x.size()
+        k = idx.size(2)
+
+        weight = conv.weight.view(conv.out_channels, -1)
+        w_diff, w_center = weight[:, :num_dims], weight[:, num_dims:]
+        scale, shift = bn_affine(bn)
+        sign = torch.where(scale >= 0, 1.0, -1.0).to(x.dtype)
+
+        x_t = x.transpose(1, 2)
+        neighbor_proj = torch.matmul(x_t, (w_diff * sign[:, None]).t()).reshape(batch_size * num_points, -1)
+        center_proj = torch.matmul(x_t, (w_center - w_diff).t())
+
+        idx_base = torch.arange(0, batch_size, device=x.device).view(-1, 1, 1) * num_points
+        idx = (idx + idx_base).view(-1, k)
+        pooled = neighbor_proj[idx[:, 0]]
+        for j in range(1, k):
+            torch.maximum(pooled, neighbor_proj[idx[:, j]], out=pooled)
+
+        pooled = pooled.view(batch_size, num_points, -1) * sign + center_proj
+        return act(pooled * scale + shift).transpose(1, 2)
+
+
 class DGCNN(nn.Module):
     """Dynamic Graph CNN for point cloud classification."""
 
-    def __init__(self, num_classes, k=20):
+    def __init__(self, num_classes, k=20, per_point=False, knn_chunk_size=None, lean_edge_conv=False,
+                 static_graph=None):
         """
         Args:
             num_classes: Number of output classes
             k: Number of nearest neighbors for graph construction
+            per_point: Use the graph-free fast path (see forward_per_point) in eval mode
+            knn_chunk_size: Tile size of the blocked kNN search (None = dense distance matrix)
+            lean_edge_conv: Use EdgeConv.forward_lean in eval mode (no k-times expanded tensors)
+            static_graph: EdgeConv layers (1-4) that reuse a single kNN graph built
+                on the input xyz instead of a dynamic graph in feature space;
+                True for all four layers, None for the fully dynamic model
         """
         super(DGCNN, self).__init__()
         self.k = k
+        self.per_point = per_point
+        self.knn_chunk_size = knn_chunk_size
+        self.lean_edge_conv = lean_edge_conv
+        self.static_graph = frozenset((1, 2, 3, 4) if static_graph is True else static_graph or ())
 
         # EdgeConv layers
-        self.conv1 = nn.Sequential(
-            nn.Conv2d(5 * 2, 64, kernel_size=1, bias=False),
-            nn.BatchNorm2d(64),
-            nn.LeakyReLU(negative_slope=0.2))
-
-        self.conv2 = nn.Sequential(
-            nn.Conv2d(64 * 2, 64, kernel_size=1, bias=False),
-            nn.BatchNorm2d(64),
-            nn.LeakyReLU(negative_slope=0.2))
-
-        self.conv3 = nn.Sequential(
-            nn.Conv2d(64 * 2, 128, kernel_size=1, bias=False),
-            nn.BatchNorm2d(128),
-            nn.LeakyReLU(negative_slope=0.2))
-
-        self.conv4 = nn.Sequential(
-            nn.Conv2d(128 * 2, 256, kernel_size=1, bias=False),
-            nn.BatchNorm2d(256),
-            nn.LeakyReLU(negative_slope=0.2))
+        self.conv1 = EdgeConv(5, 64)
+        self.conv2 = EdgeConv(64, 64)
+        self.conv3 = EdgeConv(64, 128)
+        self.conv4 = EdgeConv(128, 256)
 
         # Global feature layer
         self.conv5 = nn.Sequential(
@@ -54,39 +181,129 @@ class DGCNN(nn.Module):
         self.dropout = nn.Dropout(p=0.5)
 
     def forward(self, x):
-        """Forward pass."""
-        batch_size = x.size(0)
+        """
+        Forward pass.
+
+        Args:
+            x: Isolated points of shape (batch_size, 5), or spatial patches of
+               shape (batch_size, 5, num_points)
+        Returns:
+            Logits of shape (batch_size, num_classes) for isolated points, or
+            per-point logits of shape (batch_size, num_classes, num_points) for patches
+        """
+        if x.dim() == 3:
+            return self.forward_patches(x)
+
+        if self.per_point and not self.training:
+            return self.forward_per_point(x)
 
         # Add artificial point dimension
         x = x.unsqueeze(1).permute(0, 2, 1)
 
         # EdgeConv blocks
-        x1 = self.get_graph_feature(x)
-        x1 = self.conv1(x1).max(dim=-1, keepdim=False)[0]
-
-        x2 = self.get_graph_feature(x1)
-        x2 = self.conv2(x2).max(dim=-1, keepdim=False)[0]
-
-        x3 = self.get_graph_feature(x2)
-        x3 = self.conv3(x3).max(dim=-1, keepdim=False)[0]
-
-        x4 = self.get_graph_feature(x3)
-        x4 = self.conv4(x4).max(dim=-1, keepdim=False)[0]
+        x4 = self._edge_conv_blocks(x)
 
         # Global feature
         x5 = self.conv5(x4).max(dim=-1, keepdim=False)[0]
 
         # Classification
-        x = F.leaky_relu(self.fc1(x5), negative_slope=0.2)
+        return self._classification(x5)
+
+    def forward_patches(self, x):
+        """
+        Per-point classification of spatial patches.
+
+        The kNN graph is built over the real neighbors inside each patch. The
+        global max pooling is skipped so that conv5 and the classification
+        head are applied to every point, as in the per-point model.
+
+        Args:
+            x: Patches of shape (batch_size, 5, num_points)
+        """
+        x5 = self.conv5(self._edge_conv_blocks(x))
+        return self._classification(x5.transpose(1, 2)).transpose(1, 2)
+
+    def _edge_conv_blocks(self, x):
+        """Apply the four EdgeConv blocks, rebuilding the graph before each dynamic one."""
+        num_points = x.size(2)
+        static_idx = None
+        if self.static_graph and num_points > 1:
+            static_idx = knn(x[:, :3], min(self.k, num_points - 1), self.knn_chunk_size)
+
+        for layer, block in enumerate((self.conv1, self.conv2, self.conv3, self.conv4), start=1):
+            x = self._edge_conv(block, x, static_idx if layer in self.static_graph else None)
+        return x
+
+    def _edge_conv(self, block, x, idx=None):
+        """One EdgeConv block, max-pooled over the neighbors (idx = precomputed kNN graph)."""
+        if not self.lean_edge_conv or self.training:
+            return block(self.get_graph_feature(x, idx)).max(dim=-1, keepdim=False)[0]
+
+        num_points = x.size(2)
+        if num_points == 1:
+            return block.forward_center(x)
+        if idx is None:
+            idx = knn(x, min(self.k, num_points - 1), self.knn_chunk_size)
+        return block.forward_lean(x, idx)
+
+    def forward_per_point(self, x):
+        """
+        Graph-free forward pass for isolated points.
+
+        Each sample is a single point, so get_graph_feature only ever sees k
+        identical copies: every edge feature is [0, x] and the max over
+        neighbors is a no-op. Each EdgeConv therefore reduces to the center
+        half of its 1x1 kernel followed by BatchNorm and LeakyReLU, which is
+        applied here directly. Logits match forward() for the same state_dict.
+
+        Args:
+            x: Points of shape (batch_size, 5)
+        """
+        x = x.unsqueeze(-1)
+        for block in (self.conv1, self.conv2, self.conv3, self.conv4):
+            x = block.forward_center(x)
+
+        x5 = self.conv5(x).squeeze(-1)
+        return self._classification(x5)
+
+    @torch.no_grad()
+    def fuse_per_point(self):
+        """
+        Per-point model as a plain Linear / LeakyReLU stack for serving.
+
+        Every BatchNorm is folded into the preceding conv using its running
+        statistics, and each EdgeConv keeps only the center half of its kernel
+        (see forward_per_point). The result only holds nn.Linear layers, so
+        quantize_dynamic covers the conv layers as well as fc1-fc3.
+        """
+        layers = []
+        for block in (self.conv1, self.conv2, self.conv3, self.conv4, self.conv5):
+            conv, bn, act = block
+            weight = conv.weight.flatten(1)
+            if isinstance(block, EdgeConv):
+                weight = weight[:, weight.size(1) // 2:]
+            scale, shift = bn_affine(bn)
+
+            linear = nn.Linear(weight.size(1), weight.size(0))
+            linear.weight.copy_(weight * scale[:, None])
+            linear.bias.copy_(shift)
+            layers += [linear, nn.LeakyReLU(negative_slope=0.2)]
+
+        layers += [copy.deepcopy(self.fc1), nn.LeakyReLU(negative_slope=0.2),
+                   copy.deepcopy(self.fc2), nn.LeakyReLU(negative_slope=0.2),
+                   copy.deepcopy(self.fc3)]
+        return nn.Sequential(*layers).to(self.fc3.weight.device).eval()
+
+    def _classification(self, x):
+        """Fully connected classification head."""
+        x = F.leaky_relu(self.fc1(x), negative_slope=0.2)
         x = self.dropout(x)
         x = F.leaky_relu(self.fc2(x), negative_slope=0.2)
         x = self.dropout(x)
-        x = self.fc3(x)
-
-        return x
+        return self.fc3(x)
 
-    def get_graph_feature(self, x):
-        """Construct dynamic graph feature."""
+    def get_graph_feature(self, x, idx=None):
+        """Construct dynamic graph feature, or static graph feature from precomputed kNN indices."""
         batch_size, num_dims, num_points = x.size()
 
         # Handle single-point case
@@ -94,15 +311,10 @@ class DGCNN(nn.Module):
             x = x.repeat(1, 1, self.k)
             num_points = self.k
 
-        # Calculate pairwise distances
-        x_t = x.permute(0, 2, 1)
-        inner = -2 * torch.matmul(x_t, x)
-        xx = torch.sum(x ** 2, dim=1, keepdim=True)
-        pairwise_distance = -xx - inner - xx.permute(0, 2, 1)
-
         # Get k nearest neighbors
-        k = min(self.k, num_points - 1)
-        idx = pairwise_distance.topk(k=k + 1, dim=-1)[1][..., 1:]
+        if idx is None:
+            idx = knn(x, min(self.k, num_points - 1), self.knn_chunk_size)
+        k = idx.size(2)
 
         # Gather neighbors
         idx_base = torch.arange(0, batch_size, device=x.device).view(-1, 1, 1) * num_points
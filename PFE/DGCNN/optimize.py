@@ -0,0 +1,75 @@
+"""
+Offline optimization of a trained DGCNN for CPU serving.
+Folds every BatchNorm into the preceding conv, collapses the per-point model
+to a Linear stack, applies dynamic int8 quantization and saves a TorchScript
+serving artifact, unless macro-F1 on the test split drops too much:
+
+    python optimize.py --model experiments/best_model.pth --max-f1-drop 0.01
+    python inference.py cloud.npy --models experiments/best_model.int8.pt --backend torchscript
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+from torch.ao.quantization import quantize_dynamic
+
+from models.backends import load_eager
+from utils.metrics import compute_metrics
+
+
+def predict_array(model, features, batch_size=8192):
+    """Class ids of an (N, 5) array, classified in large inference-only batches."""
+    preds = []
+    with torch.no_grad():
+        for i in range(0, len(features), batch_size):
+            batch = torch.from_numpy(np.ascontiguousarray(features[i:i + batch_size], dtype=np.float32))
+            preds.append(model(batch).argmax(dim=1).numpy())
+    return np.concatenate(preds)
+
+
+def score(name, model, data):
+    start = time.perf_counter()
+    metrics = compute_metrics(data[:, 5].astype(int) - 1, predict_array(model, data[:, :5]), num_classes=4)
+    speed = len(data) / (time.perf_counter() - start)
+    print(f"  {name:<24} F1 macro {metrics['f1_macro']:.4f} | accuracy {metrics['accuracy']:.4f} "
+          f"| {speed:,.0f} points/sec")
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fusion BatchNorm + quantification int8 pour le service CPU')
+    parser.add_argument('--model', type=str, default='experiments/best_model.pth')
+    parser.add_argument('--test-data', type=str, default='data/test.npy')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Artefact TorchScript (défaut: <model>.int8.pt)')
+    parser.add_argument('--max-f1-drop', type=float, default=0.01,
+                        help='Baisse maximale de F1 macro tolérée sur le jeu de test')
+    parser.add_argument('--no-quantize', action='store_true', help='Fusion BatchNorm seule (fp32)')
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + ('.fused.pt' if args.no_quantize else '.int8.pt')
+    data = np.load(args.test_data, mmap_mode='r')
+
+    model = load_eager(args.model, 'cpu')
+    optimized = model.fuse_per_point()
+    if not args.no_quantize:
+        optimized = quantize_dynamic(optimized, {torch.nn.Linear}, dtype=torch.qint8)
+
+    print(f"Jeu de test : {len(data):,} points")
+    reference = score('fp32', model, data)
+    candidate = score('fused' if args.no_quantize else 'fused + int8 dynamic', optimized, data)
+
+    drop = reference['f1_macro'] - candidate['f1_macro']
+    if drop > args.max_f1_drop:
+        raise SystemExit(f"Baisse de F1 macro {drop:.4f} > {args.max_f1_drop} : artefact non écrit")
+
+    traced = torch.jit.trace(optimized, torch.rand(128, 5))
+    traced.save(output)
+    print(f"Baisse de F1 macro {drop:.4f} <= {args.max_f1_drop} : artefact écrit dans {output}")
+
+
+if __name__ == '__main__':
+    main()
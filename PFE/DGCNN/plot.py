@@ -0,0 +1,24 @@
+"""
+Render the training curves from the per-epoch metrics log written by train.py:
+
+    python plot.py experiments/metrics.jsonl --output experiments/plots
+"""
+
+import argparse
+
+from utils.metrics_log import FIGURES, read_metrics, render_plots
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Graphiques des métriques d\'entraînement')
+    parser.add_argument('metrics', nargs='?', default='experiments/metrics.jsonl')
+    parser.add_argument('--output', type=str, default='experiments/plots')
+    args = parser.parse_args()
+
+    history = read_metrics(args.metrics)
+    render_plots(history, args.output)
+    print(f"{len(history.get('epoch', []))} epochs -> {', '.join(name for name, *_ in FIGURES)} dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Hyperparameter sweep: trials of train.py run in parallel in a process pool.
+
+The search space is the `sweep` section of config.yaml (grid or random
+search over the options of train.py). Every trial gets a fixed budget of
+intra-op threads, pinned to its own cores when the machine has enough, and
+reads the memory-mapped splits, so the page cache holding the data is shared
+by all trials. Options not handled by the sweep are passed to every trial:
+
+    python sweep.py --parallel 4 --threads 2 -- --amp bf16
+"""
+
+import argparse
+import contextlib
+import csv
+import itertools
+import multiprocessing as mp
+import os
+import traceback
+
+import numpy as np
+import yaml
+
+from train import parse_args, train
+from utils.distributed import usable_cores
+
+_cores = None  # cores of the current pool worker
+
+
+def grid_trials(parameters):
+    """Every combination of the listed values."""
+    names = list(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*(parameters[name] for name in names))]
+
+
+def random_trials(parameters, num_trials, seed=0):
+    """
+    num_trials random draws: a list is sampled uniformly, {min, max} uniformly
+    in the range and {min, max, log: true} log-uniformly.
+    """
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(num_trials):
+        trial = {}
+        for name, space in parameters.items():
+            if isinstance(space, dict):
+                # YAML lit 1e-3 (sans point) comme une chaîne
+                low, high = (float(v) if isinstance(v, str) else v for v in (space['min'], space['max']))
+                if space.get('log'):
+                    value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                else:
+                    value = float(rng.uniform(low, high))
+                trial[name] = int(round(value)) if isinstance(low, int) and isinstance(high, int) else value
+            else:
+                trial[name] = space[rng.integers(len(space))]
+        trials.append(trial)
+    return trials
+
+
+def trial_argv(params):
+    """Trial values as train.py options, converted and validated by parse_args like on the command line."""
+    argv = []
+    for name, value in params.items():
+        flag = '--' + name.replace('_', '-')
+        if isinstance(value, bool):  # store_true
+            argv += [flag] if value else []
+        else:
+            argv += [flag, str(value)]
+    return argv
+
+
+def _init_worker(slots, threads):
+    """
+    Reserve a slot of `threads` cores for this pool process, for all its
+    trials, taken from the cores the sweep may use (affinity mask / cpuset).
+    """
+    global _cores
+    slot = slots.get()
+    cores = usable_cores()[slot * threads:(slot + 1) * threads]
+    if hasattr(os, 'sched_setaffinity') and len(cores) == threads:
+        os.sched_setaffinity(0, cores)
+        _cores = cores
+
+
+def _run_trial(trial_id, params, train_argv, output_dir, threads):
+    trial_dir = os.path.join(output_dir, f"trial_{trial_id:03d}")
+    # Données partagées en lecture seule (mmap), pas de workers DataLoader dans un processus du pool
+    args = parse_args(train_argv + trial_argv(params) + ['--output-dir', trial_dir, '--threads', str(threads),
+                                                         '--num-workers', '0', '--plots', 'none', '--mmap'])
+
+    os.makedirs(trial_dir, exist_ok=True)
+    with open(os.path.join(trial_dir, 'train.log'), 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            summary = train(args)
+        except BaseException as e:
+            traceback.print_exc(file=log)
+            # SystemExit ne doit pas tuer le processus du pool (l'essai ne reviendrait jamais)
+            raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    return {'trial': trial_id, **params, **summary, 'cores': _cores}
+
+
+def print_table(results, names):
+    header = f"{'trial':>5} " + ' '.join(f"{name:>13}" for name in names) + \
+             f" {'best val F1':>11} {'epochs':>6} {'time':>8} {'samples/s':>10}"
+    print(header)
+    for r in sorted(results, key=lambda r: r.get('best_val_f1', -1.0), reverse=True):
+        row = f"{r['trial']:>5} " + ' '.join(f"{r[name]!s:>13.13}" for name in names)
+        if 'error' in r:
+            print(f"{row} {'échec':>11}  {r['error']}")
+        else:
+            print(f"{row} {r['best_val_f1']:>11.4f} {r['epochs']:>6} {r['seconds']:>7.0f}s "
+                  f"{r['samples_per_sec']:>10,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recherche d\'hyperparamètres DGCNN (essais en parallèle)')
+    parser.add_argument('--config', type=str, default='config.yaml', help='section sweep de la configuration')
+    parser.add_argument('--method', choices=['grid', 'random'], default=None)
+    parser.add_argument('--trials', type=int, default=None, help='nombre d\'essais (recherche aléatoire)')
+    parser.add_argument('--parallel', type=int, default=None,
+                        help='essais simultanés (défaut : cœurs utilisables / threads)')
+    parser.add_argument('--threads', type=int, default=1, help='threads (cœurs) par essai')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', type=str, default='experiments/sweep')
+    args, train_argv = parser.parse_known_args()
+    train_argv = [arg for arg in train_argv if arg != '--']
+
+    with open(args.config) as f:
+        sweep = (yaml.safe_load(f) or {}).get('sweep', {})
+    parameters = sweep.get('parameters', {})
+    known = vars(parse_args([]))
+    unknown = [name for name in parameters if name not in known]
+    if unknown:
+        raise SystemExit(f"Paramètres inconnus de train.py : {', '.join(unknown)}")
+    if 'epochs' in sweep and 'epochs' not in parameters:
+        train_argv = ['--epochs', str(sweep['epochs'])] + train_argv
+
+    method = args.method or sweep.get('method', 'grid')
+    if method == 'grid':
+        trials = grid_trials(parameters)
+    else:
+        trials = random_trials(parameters, args.trials or sweep.get('trials', 8), args.seed)
+    for trial in trials:  # valeurs invalides signalées avant de lancer le moindre essai
+        parse_args(train_argv + trial_argv(trial))
+
+    parallel = args.parallel or max(1, len(usable_cores()) // args.threads)
+    parallel = min(parallel, len(trials))
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"{len(trials)} essais ({method}) | {parallel} en parallèle x {args.threads} thread(s)")
+
+    ctx = mp.get_context('spawn')
+    slots = ctx.Queue()
+    for slot in range(parallel):
+        slots.put(slot)
+
+    results = []
+    with ctx.Pool(parallel, initializer=_init_worker, initargs=(slots, args.threads)) as pool:
+        jobs = [pool.apply_async(_run_trial, (i, trial, train_argv, args.output_dir, args.threads))
+                for i, trial in enumerate(trials)]
+        for i, (trial, job) in enumerate(zip(trials, jobs)):
+            try:
+                result = job.get()
+                print(f"  essai {i:03d} : F1 {result['best_val_f1']:.4f} en {result['seconds']:.0f}s")
+            except Exception as e:  # un essai en échec n'arrête pas les autres
+                result = {'trial': i, **trial, 'error': str(e)}
+                print(f"  essai {i:03d} : échec ({e})")
+            results.append(result)
+
+    names = list(parameters)
+    print()
+    print_table(results, names)
+
+    path = os.path.join(args.output_dir, 'results.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['trial', *names, 'best_val_f1', 'epochs', 'seconds',
+                                               'samples_per_sec', 'cores', 'error'])
+        writer.writeheader()
+        writer.writerows(sorted(results, key=lambda r: r['trial']))
+    print(f"\nRésultats : {path}")
+
+
+if __name__ == '__main__':
+    main()
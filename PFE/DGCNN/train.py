@@ -1,32 +1,100 @@
+import argparse
+import time
 import torch
 import torch.optim as optim
 import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel
 from models.dgcnn import DGCNN
-from utils.data_loader import get_loaders
-from utils.metrics import compute_metrics
+from utils.data_loader import get_loaders, loader_options, preload_split, stratified_subsample
+from utils.checkpoint import CheckpointWriter, capture_rng_state, restore_rng_state
+from utils.distributed import all_reduce_sum, cleanup, gather_objects, init_distributed
+from utils.metrics import ConfusionMatrix
+from utils.metrics_log import MetricsSink, PlotWorker
 from utils.early_stopping import EarlyStopping
 import numpy as np
 import os
-import matplotlib.pyplot as plt
-from datetime import datetime
 
 
-def main():
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Entraînement DGCNN')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--lr', type=float, default=0.01)
+    parser.add_argument('--weight-decay', type=float, default=1e-3)
+    parser.add_argument('--mmap', action='store_true',
+                        help='jeux lus depuis des .npy memory-mappés (splits plus grands que la RAM)')
+    parser.add_argument('--amp', choices=['none', 'bf16'], default='none',
+                        help='autocast bf16 (CPU ou GPU) pour la passe avant et la loss')
+    parser.add_argument('--compile', action='store_true', help='torch.compile du DGCNN pour l\'entraînement')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='threads intra-op par processus (défaut sous torchrun : cœurs / processus)')
+    parser.add_argument('--num-workers', type=int, default=None,
+                        help='workers des DataLoaders (défaut : num_workers de config.yaml)')
+    parser.add_argument('--output-dir', type=str, default='experiments',
+                        help='modèles, checkpoint, metrics.jsonl et graphiques')
+    parser.add_argument('--val-every', type=int, default=1, help='valide toutes les N epochs (et à la dernière)')
+    parser.add_argument('--val-subsample', type=float, default=None, metavar='FRACTION',
+                        help='valide sur un sous-échantillon stratifié fixe, puis une passe complète en fin '
+                             'd\'entraînement')
+    parser.add_argument('--val-batch-size', type=int, default=8192)
+    parser.add_argument('--plots', choices=['background', 'none'], default='background',
+                        help='background : graphiques mis à jour par un thread ; none : uniquement '
+                             'metrics.jsonl (python plot.py pour les tracer ensuite)')
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help='état complet écrit à chaque epoch, en arrière-plan (défaut: <output-dir>/checkpoint.pth)')
+    parser.add_argument('--resume', nargs='?', const='', default=None, metavar='CHECKPOINT',
+                        help='reprend l\'entraînement là où il s\'est arrêté (défaut: --checkpoint)')
+    return parser.parse_args(argv)
+
+
+def step_stats(step_times, num_samples, seconds):
+    """Samples/sec of an epoch and percentiles of its step times (ms)."""
+    p50, p90, p99 = np.percentile(np.asarray(step_times) * 1e3, [50, 90, 99]) if step_times else (0, 0, 0)
+    return {'samples_per_sec': num_samples / seconds, 'step_ms_p50': p50, 'step_ms_p90': p90,
+            'step_ms_p99': p99, 'epoch_seconds': seconds}
+
+
+def train(args):
+    """
+    Entraîne un DGCNN avec les options de parse_args.
+
+    Returns:
+        Résumé du run : meilleure F1 macro de validation, durée, débit moyen
+    """
+    run_start = time.perf_counter()
+    # Lancé par torchrun : un processus par shard, gradients moyennés par all-reduce gloo (CPU)
+    rank, world_size = init_distributed(args.threads)
+    distributed = world_size > 1
+    main_process = rank == 0
+    device = torch.device('cuda' if torch.cuda.is_available() and not distributed else 'cpu')
 
-    # Paramètres (peuvent être modifiés ici)
+    # Paramètres (modifiables en ligne de commande)
     num_classes = 4
-    epochs = 10
-    batch_size = 128
-    learning_rate = 0.01
-    weight_decay = 1e-3
+    epochs = args.epochs
+    batch_size = args.batch_size
+    learning_rate = args.lr
+    weight_decay = args.weight_decay
 
-    os.makedirs('experiments', exist_ok=True)
-    os.makedirs('experiments/plots', exist_ok=True)
+    output_dir = args.output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = args.checkpoint or os.path.join(output_dir, 'checkpoint.pth')
+    resume_path = checkpoint_path if args.resume == '' else args.resume
 
     # Initialisation des loaders et modèle
-    train_loader, val_loader, test_loader = get_loaders(batch_size)
-    model = DGCNN(num_classes=num_classes).to(device)
+    # En distribué, chaque rang lit son propre shard du split memory-mappé
+    options = loader_options()
+    if args.num_workers is not None:
+        options['num_workers'] = args.num_workers
+    train_loader, val_loader, test_loader = get_loaders(batch_size, mmap=args.mmap or distributed,
+                                                        rank=rank, world_size=world_size, **options)
+    torch.manual_seed(0)  # mêmes poids initiaux sur tous les rangs
+    # Chemin per-point (sans graphe) en mode eval : mêmes logits, validation par grands batchs
+    model = DGCNN(num_classes=num_classes, per_point=True).to(device)
+    # Les modules DDP / compilé partagent les poids de model, qui reste celui sauvegardé
+    # (clés du state_dict inchangées)
+    train_model = DistributedDataParallel(model) if distributed else model
+    train_model = torch.compile(train_model) if args.compile else train_model
+    autocast_dtype = torch.bfloat16 if args.amp == 'bf16' else None
 
     # Optimizer et scheduler
     optimizer = optim.Adam(model.parameters(), lr=learning_rate, weight_decay=weight_decay)
@@ -46,107 +114,179 @@ def main():
         'train_acc': [],
         'val_acc': [],
         'val_f1_macro': [],
-        'val_f1_weighted': []
+        'val_f1_weighted': [],
+        'samples_per_sec': [],
+        'epoch_seconds': []
     }
 
     def train_epoch(model, loader):
+        """
+        Loss et accuracy sont accumulées sur le device et lues une seule fois
+        par epoch (pas de .item() par batch, donc pas de synchronisation).
+        Les temps de step incluent le chargement du batch. En distribué, les
+        totaux sont sommés sur les rangs et le débit est global.
+        """
         model.train()
-        total_loss, correct = 0, 0
+        # loss, bonnes prédictions, points vus
+        totals = torch.zeros(3, dtype=torch.float64, device=device)
+        step_times = []
 
+        start = last = time.perf_counter()
         for data, target in loader:
-            data, target = data.to(device), target.to(device)
-            optimizer.zero_grad()
-            output = model(data)
-            loss = criterion(output, target)
+            data, target = data.to(device, non_blocking=True), target.to(device, non_blocking=True)
+            optimizer.zero_grad(set_to_none=True)
+            with torch.autocast(device.type, dtype=autocast_dtype, enabled=autocast_dtype is not None):
+                output = model(data)
+                loss = criterion(output, target)
             loss.backward()
             optimizer.step()
 
-            total_loss += loss.item()
-            correct += (output.argmax(1) == target).sum().item()
+            totals[0] += loss.detach()
+            totals[1] += (output.argmax(1) == target).sum()
+            totals[2] += len(target)
+
+            now = time.perf_counter()
+            step_times.append(now - last)
+            last = now
+
+        total_loss, correct, seen = all_reduce_sum(totals).tolist()
+        stats = step_stats(step_times, seen, time.perf_counter() - start)
+        return total_loss / (len(loader) * world_size), correct / seen, stats
 
-        return total_loss / len(loader), correct / len(loader.dataset)
+    # Validation chargée une seule fois (shard du rang en distribué) en tenseurs contigus sur le device
+    val_full = preload_split("data/val.npy", device, val_loader.sampler.rows, pin_memory=device.type == 'cuda')
+    val_set = val_full
+    if args.val_subsample:
+        subset = stratified_subsample(val_full[1].cpu().numpy(), args.val_subsample)
+        subset = torch.from_numpy(subset).to(device)
+        val_set = (val_full[0][subset], val_full[1][subset])
+        if main_process:
+            print(f" Validation sur {args.val_subsample:.0%} stratifié du split ({len(subset):,} points par rang)")
 
-    def evaluate(model, loader):
+    def evaluate(model, features, labels):
         model.eval()
-        all_preds, all_targets = [], []
+        confusion = ConfusionMatrix(num_classes, device)
 
-        with torch.no_grad():
-            for data, target in loader:
-                data, target = data.to(device), target.to(device)
-                output = model(data)
-                all_preds.extend(output.argmax(1).cpu().numpy())
-                all_targets.extend(target.cpu().numpy())
-
-        return compute_metrics(all_targets, all_preds)
-
-    def save_plots(metrics, epoch):
-        """Sauvegarde les graphiques des métriques"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # Graphique de loss
-        plt.figure()
-        plt.plot(metrics['train_loss'], label='Train Loss')
-        plt.xlabel('Epoch')
-        plt.ylabel('Loss')
-        plt.title('Training Loss')
-        plt.legend()
-        plt.savefig(f'experiments/plots/loss_{timestamp}.png')
-        plt.close()
-
-        # Graphique d'accuracy
-        plt.figure()
-        plt.plot(metrics['train_acc'], label='Train Accuracy')
-        plt.plot(metrics['val_acc'], label='Validation Accuracy')
-        plt.xlabel('Epoch')
-        plt.ylabel('Accuracy')
-        plt.title('Accuracy Metrics')
-        plt.legend()
-        plt.savefig(f'experiments/plots/accuracy_{timestamp}.png')
-        plt.close()
-
-        # Graphique de F1 scores
-        plt.figure()
-        plt.plot(metrics['val_f1_macro'], label='F1 Macro')
-        plt.plot(metrics['val_f1_weighted'], label='F1 Weighted')
-        plt.xlabel('Epoch')
-        plt.ylabel('F1 Score')
-        plt.title('Validation F1 Scores')
-        plt.legend()
-        plt.savefig(f'experiments/plots/f1_scores_{timestamp}.png')
-        plt.close()
+        with torch.inference_mode():
+            for i in range(0, len(features), args.val_batch_size):
+                output = model(features[i:i + args.val_batch_size])
+                confusion.update(output.argmax(1), labels[i:i + args.val_batch_size])
+
+        # Matrice sommée sur les rangs : métriques identiques partout (early stopping cohérent)
+        all_reduce_sum(confusion.matrix)
+        return confusion.compute()
 
     best_val_f1 = 0.0
-    for epoch in range(1, epochs + 1):
-        train_loss, train_acc = train_epoch(model, train_loader)
-        val_metrics = evaluate(model, val_loader)
+    start_epoch = 1
+    if resume_path:
+        # Chargé sur CPU : les états RNG doivent rester des ByteTensor CPU, load_state_dict place
+        # ensuite poids et état de l'optimiseur sur le device des paramètres
+        checkpoint = torch.load(resume_path, map_location='cpu', weights_only=False)
+        if len(checkpoint['rng']) != world_size:
+            raise SystemExit(f"{resume_path} a été écrit par {len(checkpoint['rng'])} processus : "
+                             f"reprendre avec le même nombre de processus (ici {world_size})")
+        model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        scheduler.load_state_dict(checkpoint['scheduler'])
+        early_stopping.load_state_dict(checkpoint['early_stopping'])
+        metrics_history = checkpoint['metrics_history']
+        best_val_f1 = checkpoint['best_val_f1']
+        start_epoch = checkpoint['epoch'] + 1
+        # Un état RNG par rang : mêmes permutations et dropout que si le run n'avait pas été interrompu
+        restore_rng_state(checkpoint['rng'][rank])
+        if main_process:
+            print(f"Reprise depuis {resume_path} : epoch {start_epoch}/{epochs}")
+        if early_stopping.early_stop:
+            start_epoch = epochs + 1
+
+    writer = CheckpointWriter()
+    if main_process:
+        # Une ligne JSON par epoch ; graphiques rendus hors de la boucle d'entraînement
+        sink = MetricsSink(os.path.join(output_dir, 'metrics.jsonl'), start_epoch)
+        plotter = PlotWorker(os.path.join(output_dir, 'plots')) if args.plots == 'background' else None
+    for epoch in range(start_epoch, epochs + 1):
+        train_loader.sampler.set_epoch(epoch)
+        train_loss, train_acc, train_stats = train_epoch(train_model, train_loader)
+        validate = epoch % args.val_every == 0 or epoch == epochs
+        val_metrics = evaluate(model, *val_set) if validate else None
         scheduler.step()
 
-        # Mise à jour des métriques
+        # Mise à jour des métriques (NaN pour les epochs sans validation)
         metrics_history['train_loss'].append(train_loss)
         metrics_history['train_acc'].append(train_acc)
-        metrics_history['val_acc'].append(val_metrics['accuracy'])
-        metrics_history['val_f1_macro'].append(val_metrics['f1_macro'])
-        metrics_history['val_f1_weighted'].append(val_metrics['f1_weighted'])
+        for key, name in (('val_acc', 'accuracy'), ('val_f1_macro', 'f1_macro'), ('val_f1_weighted', 'f1_weighted')):
+            metrics_history[key].append(val_metrics[name] if validate else float('nan'))
+        metrics_history['samples_per_sec'].append(train_stats['samples_per_sec'])
+        metrics_history['epoch_seconds'].append(train_stats['epoch_seconds'])
 
-        print(f"\nEpoch {epoch}:")
-        print(f"Train Loss: {train_loss:.4f} | Acc: {train_acc:.2%}")
-        print(
-            f"Val Acc: {val_metrics['accuracy']:.2%} | F1 Macro: {val_metrics['f1_macro']:.4f} | F1 Weighted: {val_metrics['f1_weighted']:.4f}")
+        if main_process:
+            print(f"\nEpoch {epoch}:")
+            print(f"Train Loss: {train_loss:.4f} | Acc: {train_acc:.2%}")
+            print(f"Throughput: {train_stats['samples_per_sec']:,.0f} samples/s | step p50 "
+                  f"{train_stats['step_ms_p50']:.1f} ms, p90 {train_stats['step_ms_p90']:.1f} ms, "
+                  f"p99 {train_stats['step_ms_p99']:.1f} ms | epoch {train_stats['epoch_seconds']:.1f}s")
+            if validate:
+                print(
+                    f"Val Acc: {val_metrics['accuracy']:.2%} | F1 Macro: {val_metrics['f1_macro']:.4f} | F1 Weighted: {val_metrics['f1_weighted']:.4f}")
 
-        # Sauvegarde des graphiques
-        save_plots(metrics_history, epoch)
+            sink.log(epoch, **{key: values[-1] for key, values in metrics_history.items()},
+                     **{key: train_stats[key] for key in ('step_ms_p50', 'step_ms_p90', 'step_ms_p99')})
+            if plotter:
+                plotter.submit(metrics_history)
 
-        # Early stopping check
-        if early_stopping(val_metrics['f1_macro']):
-            print(f"Early stopping triggered at epoch {epoch}")
-            break
+        # Early stopping check (mêmes métriques sur tous les rangs : décision identique ;
+        # patience comptée en validations)
+        stop = validate and early_stopping(val_metrics['f1_macro'])
 
         # Sauvegarde du meilleur modèle
-        if val_metrics['f1_macro'] > best_val_f1:
+        if validate and val_metrics['f1_macro'] > best_val_f1:
             best_val_f1 = val_metrics['f1_macro']
-            torch.save(model.state_dict(), 'experiments/best_model.pth')
+            if main_process:
+                writer.save(model.state_dict(), os.path.join(output_dir, 'best_model.pth'))
+
+        # Checkpoint complet (écrit en arrière-plan, renommage atomique)
+        rng_states = gather_objects(capture_rng_state())
+        if main_process:
+            writer.save({
+                'epoch': epoch,
+                'model': model.state_dict(),
+                'optimizer': optimizer.state_dict(),
+                'scheduler': scheduler.state_dict(),
+                'early_stopping': early_stopping.state_dict(),
+                'metrics_history': metrics_history,
+                'best_val_f1': best_val_f1,
+                'rng': rng_states,
+            }, checkpoint_path)
+
+        if stop:
+            if main_process:
+                print(f"Early stopping triggered at epoch {epoch}")
+            break
+
+    if args.val_subsample and start_epoch <= epochs:
+        final_metrics = evaluate(model, *val_full)
+        if main_process:
+            print(f"\nValidation complète (modèle final) : Acc {final_metrics['accuracy']:.2%} | "
+                  f"F1 Macro: {final_metrics['f1_macro']:.4f} | F1 Weighted: {final_metrics['f1_weighted']:.4f}")
 
-    torch.save(model.state_dict(), 'experiments/final_model.pth')
+    if main_process:
+        writer.save(model.state_dict(), os.path.join(output_dir, 'final_model.pth'))
+        sink.close()
+        if plotter:
+            plotter.close()
+    writer.close()
+    cleanup()
+
+    return {
+        'best_val_f1': best_val_f1,
+        'epochs': len(metrics_history['train_loss']),
+        'seconds': time.perf_counter() - run_start,
+        'samples_per_sec': float(np.mean(metrics_history['samples_per_sec'])) if metrics_history['samples_per_sec'] else 0.0,
+    }
+
+
+def main():
+    train(parse_args())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,190 @@
+"""
+Batch-size / intra-op thread autotuning for per-point inference.
+
+The best configuration measured on a synthetic cloud is stored in
+autotune.json, keyed by machine (CPU/GPU model, usable cores, torch
+version) then by model file and backend, and picked up by DGCNNInference:
+
+    python autotune.py --models models/best_model.pth --backend eager
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from models.backends import artifact_path, load_backend
+from utils.distributed import usable_cores
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+TUNING_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'autotune.json')
+BATCH_SIZES = (32, 64, 128, 256, 512, 1024, 2048)
+
+
+def cpu_model():
+    """CPU model name (Linux /proc/cpuinfo), or the architecture reported by platform."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def machine_key(device='cpu'):
+    """
+    Hardware only, no host name: containers get a new one on every deploy
+    and the tuning must still be found on identical machines.
+    """
+    device = torch.device(device)
+    hardware = torch.cuda.get_device_name(device) if device.type == 'cuda' else \
+        f"{cpu_model()} x{len(usable_cores())}"
+    return f"{hardware} | torch {torch.__version__}"
+
+
+def model_key(model_path, backend):
+    """Backend + SHA-256 of the file actually served (exported artifact for torchscript / onnxruntime)."""
+    digest = hashlib.sha256()
+    with open(artifact_path(model_path, backend), 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return f"{backend}:{digest.hexdigest()[:16]}"
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_tuning(model_path, backend, device='cpu', path=TUNING_FILE):
+    """
+    Tuned {'batch_size', 'threads', ...} of this machine and model, or None
+    (also when the exported artifact is missing: load_backend reports it).
+    """
+    if not os.path.exists(artifact_path(model_path, backend)):
+        return None
+    return _read(path).get(machine_key(device), {}).get(model_key(model_path, backend))
+
+
+@contextlib.contextmanager
+def _locked(path):
+    """Exclusive lock (path.lock) shared by every process writing or tuning this table."""
+    with open(f"{path}.lock", 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _update(tuning, model_path, backend, device, path):
+    """Read-modify-write of the table; the caller holds the lock."""
+    table = _read(path)
+    table.setdefault(machine_key(device), {})[model_key(model_path, backend)] = tuning
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.autotune.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(table, f, indent=2)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+
+def save_tuning(tuning, model_path, backend, device='cpu', path=TUNING_FILE):
+    with _locked(path):
+        _update(tuning, model_path, backend, device, path)
+
+
+def tune_once(model_path, backend='eager', device='cpu', path=TUNING_FILE):
+    """
+    First-run hook: the first process to get the lock measures, the others
+    (e.g. every worker of a web server starting at once) wait and then read
+    its result instead of measuring concurrently on the same cores.
+    """
+    with _locked(path):
+        tuning = load_tuning(model_path, backend, device, path)
+        if tuning is None:
+            tuning = autotune(model_path, backend, device, path=path, save=False)
+            _update(tuning, model_path, backend, device, path)
+    return tuning
+
+
+def thread_candidates(cores=None):
+    """Powers of two up to the number of usable cores, plus that number itself."""
+    cores = cores or len(usable_cores())
+    candidates = {cores}
+    threads = 1
+    while threads < cores:
+        candidates.add(threads)
+        threads *= 2
+    return sorted(candidates)
+
+
+def _points_per_sec(model, points, batch_size):
+    """
+    Same loop as DGCNNInference._classify: the classes of each batch are
+    copied to the host, which also waits for the CUDA kernels, so GPU timings
+    are not just the launch overhead.
+    """
+    with torch.no_grad():
+        model(points[:batch_size]).argmax(dim=1).cpu()  # warm-up (allocations, ONNX Runtime session)
+        start = time.perf_counter()
+        for i in range(0, len(points), batch_size):
+            model(points[i:i + batch_size]).argmax(dim=1).cpu().numpy()
+    return len(points) / (time.perf_counter() - start)
+
+
+def autotune(model_path, backend='eager', device='cpu', num_points=20_000, batch_sizes=BATCH_SIZES,
+             threads=None, path=TUNING_FILE, verbose=True, save=True):
+    """
+    Measure points/sec for every (threads, batch size) pair on a synthetic
+    cloud, save the fastest configuration to `path` and return it. The model
+    is reloaded for every thread count, since ONNX Runtime fixes its thread
+    pool when the session is created.
+    """
+    device = torch.device(device)
+    rng = np.random.default_rng(0)
+    nr = rng.integers(1, 5, num_points)
+    cloud = np.column_stack((rng.random((num_points, 3)), np.minimum(rng.integers(1, 5, num_points), nr), nr))
+    points = torch.tensor(cloud, dtype=torch.float32, device=device)
+
+    previous_threads = torch.get_num_threads()
+    results = []
+    try:
+        for num_threads in threads or thread_candidates():
+            torch.set_num_threads(num_threads)
+            model = load_backend(model_path, backend, device)
+            for batch_size in batch_sizes:
+                speed = _points_per_sec(model, points, batch_size)
+                results.append({'batch_size': batch_size, 'threads': num_threads, 'points_per_sec': round(speed)})
+                if verbose:
+                    print(f"  threads {num_threads:>3} | batch {batch_size:>5} : {speed:>12,.0f} points/sec")
+    finally:
+        torch.set_num_threads(previous_threads)
+
+    best = max(results, key=lambda r: r['points_per_sec'])
+    if save:
+        save_tuning(best, model_path, backend, device, path)
+    if verbose:
+        print(f"Meilleure configuration : batch {best['batch_size']}, {best['threads']} thread(s) "
+              f"({best['points_per_sec']:,} points/sec) -> {path}")
+    return best
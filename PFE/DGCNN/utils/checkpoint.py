@@ -0,0 +1,92 @@
+"""
+Training checkpoints: full state (model, optimizer, scheduler, early stopping,
+metrics, RNG) written by a background thread so that torch.save does not
+block the training loop. Files are written to a temporary name then renamed,
+so an interrupted write never leaves a truncated checkpoint behind.
+"""
+
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+import torch
+
+
+def snapshot(obj):
+    """Copy of a (nested) state with every tensor detached and cloned to CPU."""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+
+def capture_rng_state():
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def atomic_save(obj, path):
+    tmp_path = f"{path}.tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter:
+    """
+    Background writer: save() snapshots the state on the calling thread (the
+    only part that has to be synchronous) and returns, the serialization and
+    the atomic rename happen on a worker thread. Writes are done in order.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            obj, path = item
+            try:
+                atomic_save(obj, path)
+            except Exception as e:  # re-raised on the training thread by save() / close()
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"Échec de l'écriture du checkpoint : {error}") from error
+
+    def save(self, obj, path):
+        self._check()
+        self._queue.put((snapshot(obj), path))
+
+    def wait(self):
+        """Block until every pending checkpoint is on disk."""
+        self._queue.join()
+        self._check()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._check()
@@ -4,69 +4,238 @@ Data loading utilities for point cloud classification.
 
 import torch
 import numpy as np
-from torch.utils.data import Dataset, DataLoader
+import yaml
+from torch.utils.data import Dataset, DataLoader, Sampler
 
 
 class PointCloudDataset(Dataset):
     """Custom Dataset for point cloud classification."""
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, mmap=False):
         """
         Args:
             file_path: Path to .npy file containing point cloud data1
+            mmap: Serve rows straight from a memory-mapped file instead of
+                loading it; only the requested rows are read (and converted
+                to float32 if the file is float64), so splits larger than RAM
+                can be used and DataLoader workers share the page cache
         """
+        self.file_path = file_path
+        self.mmap = mmap
+        self._data = None
+        if mmap:
+            return
+
         data = np.load(file_path)
         # Features: x,y,z, return_number, number_of_returns
         self.features = torch.tensor(data[:, :5], dtype=torch.float32)
         # Labels: classification (converted to 0-based index)
         self.labels = torch.tensor(data[:, 5], dtype=torch.long) - 1
 
+    @property
+    def data(self):
+        """Memory-mapped (N, 6) array, opened lazily (once per DataLoader worker)."""
+        if self._data is None:
+            # Copy-on-write mapping: writable views for torch.from_numpy, the file is never modified
+            self._data = np.load(self.file_path, mmap_mode='c')
+        return self._data
+
+    def __getstate__(self):
+        # A pickled memmap would be sent to each worker as a full in-memory copy: reopen it instead
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
     def __len__(self):
+        if self.mmap:
+            return len(self.data)
         return len(self.features)
 
     def __getitem__(self, idx):
-        return self.features[idx], self.labels[idx]
+        if not self.mmap:
+            return self.features[idx], self.labels[idx]
+
+        rows = self.data[idx]
+        features = rows[..., :5]
+        if features.dtype != np.float32:
+            features = features.astype(np.float32)
+        # Label decoded on access: classification (converted to 0-based index)
+        labels = rows[..., 5].astype(np.int64) - 1
+        return torch.from_numpy(features), torch.as_tensor(labels)
+
+
+class BatchIndexSampler(Sampler):
+    """
+    Yields one index per batch instead of one per point: a sorted index array
+    of a random permutation when shuffling, a contiguous slice otherwise. Used
+    with DataLoader(batch_size=None), the dataset is indexed once per batch
+    (a single fancy-index / zero-copy slice) and nothing is collated.
+
+    With world_size > 1, only the shard of rank is served. Shards are either
+    contiguous and as balanced as possible (every row served once, e.g. for
+    evaluation) or, with even_shards, interleaved (rows rank, rank +
+    world_size, ...) and all of n // world_size rows so that every rank runs
+    the same number of steps (training with all-reduce). Splits keep the
+    spatial order of the tile: interleaving gives every rank points of the
+    whole tile, so the BatchNorm statistics broadcast from rank 0 by DDP are
+    not those of a single region.
+
+    Shuffling uses a generator seeded with seed + epoch (set_epoch), the same
+    on every rank. With even_shards, one permutation of the whole split is
+    drawn and rank takes perm[rank::world_size]: the global batch is a
+    random sample of the split, not world_size neighboring rows.
+    """
+
+    def __init__(self, num_samples, batch_size, shuffle=False, drop_last=False, seed=0,
+                 rank=0, world_size=1, even_shards=False):
+        self.total = num_samples
+        self.rank, self.world_size, self.even_shards = rank, world_size, even_shards
+        if even_shards:
+            self.start, self.step = rank, world_size
+            self.stop = rank + world_size * (num_samples // world_size)
+        else:
+            self.start, self.step = num_samples * rank // world_size, 1
+            self.stop = num_samples * (rank + 1) // world_size
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        """Permutation of the next epoch (call before iterating, with the same epoch on every rank)."""
+        self.epoch = epoch
+
+    @property
+    def rows(self):
+        """Rows of the shard, as a slice of the dataset."""
+        return slice(self.start, self.stop, self.step)
+
+    @property
+    def num_samples(self):
+        """Rows served per epoch."""
+        return (self.stop - self.start) // self.step
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
 
+    def __iter__(self):
+        stop = len(self) * self.batch_size
+        if not self.shuffle:
+            for start in range(0, stop, self.batch_size):
+                end = min(start + self.batch_size, self.num_samples)
+                yield slice(self.start + start * self.step, self.start + end * self.step, self.step)
+            return
 
-def get_loaders(batch_size=16):
-    """Create data1 loaders for train/val/test sets."""
-    print(" Loading datasets...")
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        if self.even_shards:
+            perm = torch.randperm(self.total, generator=generator).numpy()
+            perm = perm[self.rank::self.world_size][:self.num_samples]
+        else:
+            perm = torch.randperm(self.num_samples, generator=generator).numpy() + self.start
+        for start in range(0, stop, self.batch_size):
+            # Sorted within the batch: same points, sequential reads on a memory-mapped split
+            yield np.sort(perm[start:start + self.batch_size])
+
+
+def make_loader(dataset, batch_size, shuffle=False, num_workers=0, persistent_workers=False, prefetch_factor=None,
+                rank=0, world_size=1, even_shards=False):
+    """DataLoader serving whole batches from dataset[indices] (see BatchIndexSampler)."""
+    sampler = BatchIndexSampler(len(dataset), batch_size, shuffle=shuffle,
+                                rank=rank, world_size=world_size, even_shards=even_shards)
+    return DataLoader(
+        dataset,
+        batch_size=None,
+        sampler=sampler,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        persistent_workers=persistent_workers and num_workers > 0,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None)
+
+
+def preload_split(file_path, device, rows=slice(None), pin_memory=False):
+    """
+    Load (a row range of) a split once as contiguous tensors on device: for
+    data evaluated every epoch, no DataLoader, no per-batch copy.
+
+    Returns:
+        features (N, 5) float32, labels (N,) int64 (0-based)
+    """
+    data = np.load(file_path, mmap_mode='r')[rows]
+    features = torch.from_numpy(np.ascontiguousarray(data[:, :5], dtype=np.float32))
+    labels = torch.from_numpy(data[:, 5].astype(np.int64) - 1)
+    if pin_memory:
+        features, labels = features.pin_memory(), labels.pin_memory()
+    return features.to(device, non_blocking=pin_memory), labels.to(device, non_blocking=pin_memory)
+
+
+def stratified_subsample(labels, fraction, seed=0):
+    """
+    Sorted indices of a fixed random subset holding `fraction` of every class
+    (at least one point per class present), for cheap per-epoch validation.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    indices = []
+    for cls in np.unique(labels):
+        members = np.flatnonzero(labels == cls)
+        count = max(1, int(round(fraction * len(members))))
+        indices.append(rng.choice(members, count, replace=False))
+    return np.sort(np.concatenate(indices))
+
+
+def loader_options(config_path="config.yaml"):
+    """num_workers, persistent_workers and prefetch_factor from config.yaml (defaults if absent)."""
+    try:
+        with open(config_path) as f:
+            config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        config = {}
+    return {'num_workers': config.get('num_workers', 0),
+            'persistent_workers': config.get('persistent_workers', False),
+            'prefetch_factor': config.get('prefetch_factor')}
+
+
+def get_loaders(batch_size=16, mmap=False, num_workers=0, persistent_workers=False, prefetch_factor=None,
+                rank=0, world_size=1):
+    """
+    Create data1 loaders for train/val/test sets.
+
+    Args:
+        num_workers, persistent_workers, prefetch_factor: passed to every
+            DataLoader (see loader_options to read them from config.yaml)
+        rank, world_size: data-parallel training; every loader only serves
+            the shard of rank (equal shards for train, so that all ranks
+            run the same number of steps)
+    """
+    verbose = rank == 0
+    if verbose:
+        print(" Loading datasets...")
 
     # Initialize datasets
-    train_dataset = PointCloudDataset("data/train.npy")
-    val_dataset = PointCloudDataset("data/val.npy")
-    test_dataset = PointCloudDataset("data/test.npy")
+    train_dataset = PointCloudDataset("data/train.npy", mmap=mmap)
+    val_dataset = PointCloudDataset("data/val.npy", mmap=mmap)
+    test_dataset = PointCloudDataset("data/test.npy", mmap=mmap)
 
-    print(f" Dataset sizes:")
-    print(f"  - Train: {len(train_dataset):,} points")
-    print(f"  - Val:   {len(val_dataset):,} points")
-    print(f"  - Test:  {len(test_dataset):,} points")
+    if verbose:
+        print(f" Dataset sizes:")
+        print(f"  - Train: {len(train_dataset):,} points")
+        print(f"  - Val:   {len(val_dataset):,} points")
+        print(f"  - Test:  {len(test_dataset):,} points")
 
     # Create data1 loaders
-    train_loader = DataLoader(
-        train_dataset,
-        batch_size=batch_size,
-        shuffle=True,
-        num_workers=0,
-        pin_memory=torch.cuda.is_available())
-
-    val_loader = DataLoader(
-        val_dataset,
-        batch_size=batch_size,
-        shuffle=False,
-        num_workers=0,
-        pin_memory=torch.cuda.is_available())
-
-    test_loader = DataLoader(
-        test_dataset,
-        batch_size=batch_size,
-        shuffle=False,
-        num_workers=0,
-        pin_memory=torch.cuda.is_available())
-
-    print(f"\n Batch size: {batch_size}")
-    print(f" Train batches: {len(train_loader)}")
-    print(f" Val batches:   {len(val_loader)}")
-    print(f" Test batches:  {len(test_loader)}")
-
-    return train_loader, val_loader, test_loader
\ No newline at end of file
+    options = {'num_workers': num_workers, 'persistent_workers': persistent_workers,
+               'prefetch_factor': prefetch_factor, 'rank': rank, 'world_size': world_size}
+    train_loader = make_loader(train_dataset, batch_size, shuffle=True, even_shards=True, **options)
+    val_loader = make_loader(val_dataset, batch_size, **options)
+    test_loader = make_loader(test_dataset, batch_size, **options)
+
+    if verbose:
+        print(f"\n Batch size: {batch_size}" + (f" per rank x {world_size} ranks" if world_size > 1 else ""))
+        print(f" Train batches: {len(train_loader)}")
+        print(f" Val batches:   {len(val_loader)}")
+        print(f" Test batches:  {len(test_loader)}")
+
+    return train_loader, val_loader, test_loader
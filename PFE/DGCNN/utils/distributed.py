@@ -0,0 +1,63 @@
+"""
+CPU data-parallel training helpers (torch.distributed, gloo backend).
+Processes are started by torchrun, which sets RANK / WORLD_SIZE / MASTER_ADDR:
+
+    torchrun --nproc-per-node 4 train.py --mmap
+"""
+
+import os
+
+import torch
+import torch.distributed as dist
+
+
+def usable_cores():
+    """
+    Ids of the cores this process may run on: its affinity mask, which
+    follows taskset and cgroup cpusets, unlike os.cpu_count().
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def init_distributed(threads=None):
+    """
+    Join the process group when launched by torchrun; (rank, world_size) = (0, 1) otherwise.
+    Intra-op threads default to the usable cores of the machine divided between its ranks.
+    """
+    world_size = int(os.environ.get('WORLD_SIZE', 1))
+    rank = 0
+    if world_size > 1:
+        dist.init_process_group('gloo')
+        rank = dist.get_rank()
+        local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+        threads = threads or max(1, len(usable_cores()) // local_world_size)
+    if threads:
+        torch.set_num_threads(threads)
+    return rank, world_size
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def all_reduce_sum(tensor):
+    """In-place sum over ranks (no-op in a single process)."""
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def gather_objects(obj):
+    """List of obj from every rank, in rank order ([obj] in a single process)."""
+    if not is_distributed():
+        return [obj]
+    objects = [None] * dist.get_world_size()
+    dist.all_gather_object(objects, obj)
+    return objects
+
+
+def cleanup():
+    if is_distributed():
+        dist.destroy_process_group()
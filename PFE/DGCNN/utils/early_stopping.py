@@ -31,4 +31,12 @@ class EarlyStopping:
             if self.counter >= self.patience:
                 self.early_stop = True
 
-        return self.early_stop
\ No newline at end of file
+        return self.early_stop
+
+    def state_dict(self):
+        return {'counter': self.counter, 'best_score': self.best_score, 'early_stop': self.early_stop}
+
+    def load_state_dict(self, state):
+        self.counter = state['counter']
+        self.best_score = state['best_score']
+        self.early_stop = state['early_stop']
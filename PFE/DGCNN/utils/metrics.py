@@ -1,16 +1,66 @@
-from sklearn.metrics import accuracy_score, confusion_matrix, f1_score
+import numpy as np
+import torch
 
-def compute_metrics(y_true, y_pred):
+
+def metrics_from_confusion(cm):
     """
-    Compute classification metrics including accuracy, confusion matrix and F1 scores.
+    Accuracy and F1 scores derived from a (num_classes, num_classes) confusion
+    matrix (rows: true class, columns: predicted class) in O(C²).
+    Same values as sklearn: F1 of a class with no support and no prediction
+    is 0, and the macro average only covers classes seen in y_true or y_pred.
     Returns:
         dict: Dictionary containing all metrics
     """
-    metrics = {
-        'accuracy': accuracy_score(y_true, y_pred),
-        'confusion_matrix': confusion_matrix(y_true, y_pred),
-        'f1_macro': f1_score(y_true, y_pred, average='macro'),
-        'f1_weighted': f1_score(y_true, y_pred, average='weighted'),
-        'f1_by_class': f1_score(y_true, y_pred, average=None)
+    cm = np.asarray(cm, dtype=np.int64)
+    tp = np.diag(cm).astype(np.float64)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    present = (support + predicted) > 0
+
+    denominator = support + predicted
+    f1 = np.divide(2 * tp, denominator, out=np.zeros_like(tp), where=denominator > 0)
+    total = cm.sum()
+    return {
+        'accuracy': tp.sum() / total if total else 0.0,
+        'confusion_matrix': cm,
+        'f1_macro': f1[present].mean() if present.any() else 0.0,
+        'f1_weighted': (f1 * support).sum() / support.sum() if support.sum() else 0.0,
+        'f1_by_class': f1
     }
-    return metrics
\ No newline at end of file
+
+
+def compute_metrics(y_true, y_pred, num_classes=None):
+    """
+    Compute classification metrics including accuracy, confusion matrix and F1 scores.
+    Returns:
+        dict: Dictionary containing all metrics
+    """
+    y_true = np.asarray(y_true, dtype=np.int64)
+    y_pred = np.asarray(y_pred, dtype=np.int64)
+    if num_classes is None:
+        num_classes = int(max(y_true.max(initial=0), y_pred.max(initial=0))) + 1
+    cm = np.bincount(y_true * num_classes + y_pred, minlength=num_classes * num_classes)
+    return metrics_from_confusion(cm.reshape(num_classes, num_classes))
+
+
+class ConfusionMatrix:
+    """
+    Streaming metrics: a confusion matrix updated per batch with bincount on
+    the device of the predictions, so evaluation memory does not grow with the
+    dataset and nothing is copied to the host before compute().
+    """
+
+    def __init__(self, num_classes, device='cpu'):
+        self.num_classes = num_classes
+        self.matrix = torch.zeros(num_classes * num_classes, dtype=torch.long, device=device)
+
+    def update(self, preds, targets):
+        """preds and targets: class ids (0-based) of a batch, on the device of the matrix."""
+        index = targets.reshape(-1) * self.num_classes + preds.reshape(-1)
+        self.matrix += torch.bincount(index, minlength=self.num_classes * self.num_classes)
+
+    def reset(self):
+        self.matrix.zero_()
+
+    def compute(self):
+        return metrics_from_confusion(self.matrix.view(self.num_classes, self.num_classes).cpu().numpy())
@@ -0,0 +1,129 @@
+"""
+Per-epoch metrics logging kept off the training loop.
+
+MetricsSink appends one JSON line per epoch to experiments/metrics.jsonl.
+Figures are rendered from that history either by PlotWorker, a background
+thread that overwrites one PNG per metric, or afterwards with
+`python plot.py experiments/metrics.jsonl`.
+"""
+
+import json
+import math
+import os
+import queue
+import threading
+
+# One figure per group: file name, title, y label, plotted keys
+FIGURES = [
+    ('loss.png', 'Training Loss', 'Loss', [('train_loss', 'Train Loss')]),
+    ('accuracy.png', 'Accuracy Metrics', 'Accuracy',
+     [('train_acc', 'Train Accuracy'), ('val_acc', 'Validation Accuracy')]),
+    ('f1_scores.png', 'Validation F1 Scores', 'F1 Score',
+     [('val_f1_macro', 'F1 Macro'), ('val_f1_weighted', 'F1 Weighted')]),
+    ('throughput.png', 'Training Throughput', 'Samples/sec', [('samples_per_sec', 'Train samples/sec')]),
+]
+
+
+class MetricsSink:
+    """JSONL log: one row per epoch, flushed immediately."""
+
+    def __init__(self, path, start_epoch=1):
+        """
+        Args:
+            start_epoch: First epoch about to be logged; rows of earlier epochs
+                are kept (resumed run), later ones dropped
+        """
+        self.path = path
+        kept = []
+        if start_epoch > 1 and os.path.exists(path):
+            with open(path) as f:
+                kept = [line for line in f if line.strip() and json.loads(line)['epoch'] < start_epoch]
+        self._file = open(path, 'w')
+        self._file.writelines(kept)
+        self._file.flush()
+
+    def log(self, epoch, **values):
+        # NaN (epoch without validation) -> null, to keep the file valid JSON
+        row = {'epoch': epoch, **{key: None if isinstance(value, float) and math.isnan(value) else value
+                                  for key, value in values.items()}}
+        self._file.write(json.dumps(row) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def read_metrics(path):
+    """Metrics history of a JSONL log as {key: [value per epoch]} (null -> NaN)."""
+    history = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for key, value in json.loads(line).items():
+                history.setdefault(key, []).append(float('nan') if value is None else value)
+    return history
+
+
+def render_plots(history, plot_dir):
+    """Overwrite one PNG per figure group in plot_dir (object-oriented matplotlib, no pyplot state)."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    os.makedirs(plot_dir, exist_ok=True)
+    epochs = history.get('epoch')
+    for filename, title, ylabel, series in FIGURES:
+        series = [(key, label) for key, label in series if history.get(key)]
+        if not series:
+            continue
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        for key, label in series:
+            values = history[key]
+            x = epochs[-len(values):] if epochs else range(1, len(values) + 1)
+            ax.plot(x, values, marker='o' if len(values) < 30 else None, label=label)
+        ax.set_xlabel('Epoch')
+        ax.set_ylabel(ylabel)
+        ax.set_title(title)
+        ax.legend()
+        # Written next to the target then renamed: a reader never sees a half-written PNG
+        path = os.path.join(plot_dir, filename)
+        fig.savefig(path + '.tmp.png')
+        os.replace(path + '.tmp.png', path)
+
+
+class PlotWorker:
+    """
+    Background renderer: submit() hands over the latest history and returns
+    immediately. Only the most recent pending history is rendered, so a slow
+    disk or matplotlib never delays the training loop.
+    """
+
+    def __init__(self, plot_dir):
+        self.plot_dir = plot_dir
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            history = self._queue.get()
+            if history is None:
+                break
+            try:
+                render_plots(history, self.plot_dir)
+            except Exception as e:  # plots are best effort, training goes on
+                print(f"Échec du rendu des graphiques : {e}")
+
+    def submit(self, history):
+        snapshot = {key: list(values) for key, values in history.items()}
+        try:
+            self._queue.get_nowait()  # drop the stale pending history, if any
+        except queue.Empty:
+            pass
+        self._queue.put(snapshot)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
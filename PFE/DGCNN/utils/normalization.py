@@ -0,0 +1,79 @@
+"""
+Min-max normalization of the x, y, z columns, fitted chunk by chunk and
+persisted as a JSON sidecar so that inference clouds are scaled exactly like
+the training data.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+def sidecar_path(npy_path):
+    """Normalization parameters next to a preprocessed file: data.npy -> data.norm.json."""
+    return os.path.splitext(npy_path)[0] + '.norm.json'
+
+
+class MinMaxNormalizer:
+    """Streaming equivalent of sklearn's MinMaxScaler on the first three columns."""
+
+    columns = 3
+
+    def __init__(self, mins=None, maxs=None):
+        self.mins = None if mins is None else np.asarray(mins, dtype=np.float64)
+        self.maxs = None if maxs is None else np.asarray(maxs, dtype=np.float64)
+
+    @property
+    def fitted(self):
+        return self.mins is not None
+
+    def partial_fit(self, xyz):
+        """Update the bounds with an (n, 3) chunk."""
+        xyz = np.asarray(xyz)[:, :self.columns]
+        if len(xyz) == 0:
+            return self
+        chunk_mins, chunk_maxs = xyz.min(axis=0), xyz.max(axis=0)
+        if self.fitted:
+            chunk_mins, chunk_maxs = np.minimum(self.mins, chunk_mins), np.maximum(self.maxs, chunk_maxs)
+        self.mins, self.maxs = chunk_mins.astype(np.float64), chunk_maxs.astype(np.float64)
+        return self
+
+    def transform(self, xyz, out=None):
+        """
+        Scale an (n, 3) chunk with the fitted bounds. Values outside the
+        training extent are not clipped (same behavior as MinMaxScaler).
+        """
+        if not self.fitted:
+            raise RuntimeError("Normalisation non ajustée : appeler partial_fit ou load")
+        ranges = self.maxs - self.mins
+        ranges[ranges == 0] = 1.0
+        xyz = np.asarray(xyz)[:, :self.columns]
+        return np.divide(xyz - self.mins, ranges, out=out)
+
+    def apply(self, data, out=None, chunk_size=1_000_000):
+        """
+        Normalize the xyz columns of an (N, C) array (or memmap) chunk by
+        chunk, the other columns being copied as is. Bounds are applied in
+        float64 before any cast to the dtype of out, so large projected
+        coordinates keep their precision. In place when out is None.
+        """
+        if out is None:
+            out = data
+        for start in range(0, len(data), chunk_size):
+            block = data[start:start + chunk_size]
+            out[start:start + chunk_size, :self.columns] = self.transform(block)
+            if out is not data:
+                out[start:start + chunk_size, self.columns:] = block[:, self.columns:]
+        return out
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'type': 'minmax', 'columns': ['x', 'y', 'z'],
+                       'mins': self.mins.tolist(), 'maxs': self.maxs.tolist()}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            params = json.load(f)
+        return cls(params['mins'], params['maxs'])
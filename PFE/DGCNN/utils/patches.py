@@ -0,0 +1,129 @@
+"""
+Spatial patch extraction for context-aware inference.
+Indexes the cloud once with a KD-tree and cuts it into overlapping,
+fixed-size patches so that the DGCNN kNN graph sees real neighbors.
+"""
+
+import numpy as np
+import torch
+from sklearn.neighbors import KDTree
+
+
+class PatchSampler:
+    """Overlapping fixed-size spatial patches over a point cloud."""
+
+    def __init__(self, xy, patch_size=1024, overlap=2.0, leaf_size=40):
+        """
+        Args:
+            xy: Planimetric coordinates of shape (num_points, 2); patches are
+                vertical columns, so ground, vegetation and roofs stay together
+            patch_size: Number of points per patch (fixed, so batches have a constant cost)
+            overlap: Average number of patches covering each point
+            leaf_size: KD-tree leaf size
+        """
+        self.xy = np.asarray(xy, dtype=np.float64)
+        self.patch_size = min(patch_size, len(self.xy))
+        self.tree = KDTree(self.xy, leaf_size=leaf_size)
+
+        self.cell_size = self._fit_cell_size(self.patch_size / overlap)
+
+    def __len__(self):
+        """Number of patches in the first (grid) pass; the coverage pass adds a few more."""
+        return len(self._grid_cells(self.xy, self.cell_size)[1])
+
+    def batches(self, patches_per_batch=8):
+        """
+        Yield point indices of shape (patches, patch_size), batch by batch.
+
+        Patches are centered on the occupied cells of a regular XY grid. Points
+        left uncovered (sparse areas, tile borders) get extra patches anchored
+        on them, with a finer grid at each round, until every point has been
+        covered at least once.
+        """
+        covered = np.zeros(len(self.xy), dtype=bool)
+        centers = self._cell_centers(self.xy, self.cell_size)
+        anchors = None
+        cell_size = self.cell_size
+
+        while len(centers):
+            for start in range(0, len(centers), patches_per_batch):
+                idx = self.tree.query(centers[start:start + patches_per_batch],
+                                      k=self.patch_size, return_distance=False,
+                                      sort_results=False)
+                if anchors is not None:
+                    # Guarantees progress even with more than patch_size duplicate points: the
+                    # anchor is swapped into column 0 when the query returned it (unsorted
+                    # results), and replaces column 0 otherwise, so it never appears twice
+                    batch_anchors = anchors[start:start + patches_per_batch]
+                    hit = idx == batch_anchors[:, None]
+                    rows = np.flatnonzero(hit.any(axis=1))
+                    idx[rows, hit[rows].argmax(axis=1)] = idx[rows, 0]
+                    idx[:, 0] = batch_anchors
+                covered[idx] = True
+                yield idx
+
+            missing = np.flatnonzero(~covered)
+            if not len(missing):
+                break
+            cell_size /= 2
+            if cell_size > 1e-3 * self.cell_size:
+                _, first = self._grid_cells(self.xy[missing], cell_size)
+                anchors = missing[first]
+            else:
+                # Stacks of identical coordinates: one patch per remaining point
+                anchors = missing
+            centers = self.xy[anchors]
+
+    def _fit_cell_size(self, points_per_cell):
+        """
+        Grid cell side so that each occupied cell holds about points_per_cell points.
+        The occupied area is re-estimated a few times so that holes and outliers
+        in the bounding box do not inflate the cells.
+        """
+        extent = np.ptp(self.xy, axis=0)
+        area = np.prod(extent)
+        cell_size = np.sqrt(area * points_per_cell / len(self.xy)) if area > 0 else extent.max()
+        if not cell_size:
+            return 1.0
+
+        for _ in range(3):
+            occupied = len(self._grid_cells(self.xy, cell_size)[1])
+            cell_size = np.sqrt(occupied * cell_size ** 2 * points_per_cell / len(self.xy))
+        return float(cell_size)
+
+    def _cell_centers(self, xy, cell_size):
+        """Centroids of the points in each occupied grid cell."""
+        inverse, _ = self._grid_cells(xy, cell_size)
+        counts = np.bincount(inverse)
+        return np.column_stack([np.bincount(inverse, weights=xy[:, d]) / counts for d in range(2)])
+
+    @staticmethod
+    def _grid_cells(xy, cell_size):
+        """Cell index of each point and the first point of each occupied cell."""
+        cells = np.floor((xy - xy.min(axis=0)) / cell_size).astype(np.int64)
+        keys = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        return inverse.ravel(), first
+
+
+def classify_patches(model, points, num_classes, device, patch_size=1024, overlap=2.0, patches_per_batch=8):
+    """
+    Classify a cloud patch by patch and merge overlapping predictions by majority vote.
+
+    Args:
+        model: Module mapping (B, 5, N) patches to (B, num_classes, N) logits
+        points: Array of shape (num_points, 5), float32
+        num_classes: Number of output classes
+        device: Device the model runs on
+    Returns:
+        0-based class id of each point
+    """
+    sampler = PatchSampler(points[:, :2], patch_size=patch_size, overlap=overlap)
+    votes = np.zeros((len(points), num_classes), dtype=np.int32)
+    with torch.no_grad():
+        for idx in sampler.batches(patches_per_batch):
+            batch = torch.from_numpy(points[idx]).permute(0, 2, 1).to(device)
+            pred = model(batch).argmax(dim=1).cpu().numpy()
+            np.add.at(votes, (idx, pred), 1)
+
+    return votes.argmax(axis=1)
@@ -163,3 +163,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')    # Pour la production
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Projet DGCNN (modèle et moteur d'inférence partagés avec l'application)
+DGCNN_DIR = os.path.join(os.path.dirname(BASE_DIR), 'DGCNN')
+# Backend d'inférence : 'eager', 'torchscript' ou 'onnxruntime' (artefacts de DGCNN/export.py)
+DGCNN_BACKEND = 'eager'
+# Autotuning (taille de batch, threads) au premier chargement du modèle sur cette machine : un seul
+# worker mesure, les autres attendent son résultat. En production, préférer lancer DGCNN/autotune.py
+# une fois avant le déploiement
+DGCNN_AUTOTUNE = False
+# Chargement + préchauffage du modèle au démarrage de chaque processus (sinon à la première requête)
+DGCNN_PRELOAD = False
+# Taille maximale du cache de résultats (media/classification_results), entrées évincées par LRU
+DGCNN_RESULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# À partir de ce nombre de points, classification à mémoire bornée (entrée en memory-map, traitée par chunks)
+DGCNN_STREAMING_MIN_POINTS = 5_000_000
+
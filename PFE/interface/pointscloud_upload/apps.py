@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PointscloudUploadConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pointscloud_upload'
+
+    def ready(self):
+        # Chargement du modèle au démarrage du processus plutôt qu'à la première requête
+        if settings.DGCNN_PRELOAD:
+            from .dgcnn_inference import get_inferencer
+            get_inferencer()
@@ -1,121 +1,34 @@
 import os
+import sys
+import threading
+import time
 import numpy as np
-import torch
 import open3d as o3d
 from matplotlib import pyplot as plt
 from django.conf import settings
 
+if settings.DGCNN_DIR not in sys.path:
+    sys.path.append(settings.DGCNN_DIR)
 
-class DGCNNInference:
-    def __init__(self, model_path=None):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+from inference import DGCNNInference as BaseInference
+from utils.autotune import model_key
+
+
+class DGCNNInference(BaseInference):
+    """DGCNNInference partagé (DGCNN/inference.py) avec les chemins et exports de l'application."""
+
+    def __init__(self, model_path=None, backend=None):
         model_path = model_path or os.path.join(settings.BASE_DIR, 'pointscloud_upload', 'models', 'best_model.pth')
+        super().__init__(model_path, backend=backend or settings.DGCNN_BACKEND, tune=settings.DGCNN_AUTOTUNE)
+        # Empreinte des poids servis, partie de la clé du cache de résultats
+        self.model_hash = model_key(self.model_path, self.backend)
 
-        class DGCNN(torch.nn.Module):
-            def __init__(self, num_classes=4, k=20):
-                super().__init__()
-                self.k = k
-                self.conv1 = torch.nn.Sequential(
-                    torch.nn.Conv2d(5 * 2, 64, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm2d(64),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.conv2 = torch.nn.Sequential(
-                    torch.nn.Conv2d(64 * 2, 64, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm2d(64),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.conv3 = torch.nn.Sequential(
-                    torch.nn.Conv2d(64 * 2, 128, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm2d(128),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.conv4 = torch.nn.Sequential(
-                    torch.nn.Conv2d(128 * 2, 256, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm2d(256),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.conv5 = torch.nn.Sequential(
-                    torch.nn.Conv1d(256, 1024, kernel_size=1, bias=False),
-                    torch.nn.BatchNorm1d(1024),
-                    torch.nn.LeakyReLU(negative_slope=0.2))
-                self.fc1 = torch.nn.Linear(1024, 512)
-                self.fc2 = torch.nn.Linear(512, 256)
-                self.fc3 = torch.nn.Linear(256, num_classes)
-                self.dropout = torch.nn.Dropout(p=0.5)
-
-            def forward(self, x):
-                batch_size = x.size(0)
-                x = x.unsqueeze(1).permute(0, 2, 1)
-                x = self._edge_conv_blocks(x)
-                x = self._classification(x)
-                return x
-
-            def _edge_conv_blocks(self, x):
-                x1 = self._get_graph_feature(x)
-                x1 = self.conv1(x1).max(dim=-1, keepdim=False)[0]
-                x2 = self._get_graph_feature(x1)
-                x2 = self.conv2(x2).max(dim=-1, keepdim=False)[0]
-                x3 = self._get_graph_feature(x2)
-                x3 = self.conv3(x3).max(dim=-1, keepdim=False)[0]
-                x4 = self._get_graph_feature(x3)
-                x4 = self.conv4(x4).max(dim=-1, keepdim=False)[0]
-                x5 = self.conv5(x4).max(dim=-1, keepdim=False)[0]
-                return x5
-
-            def _get_graph_feature(self, x):
-                batch_size, num_dims, num_points = x.size()
-                if num_points == 1:
-                    x = x.repeat(1, 1, self.k)
-                    num_points = self.k
-                x_t = x.permute(0, 2, 1)
-                pairwise_distance = -torch.sum(x ** 2, dim=1, keepdim=True) - 2 * torch.matmul(x_t, x) - torch.sum(
-                    x ** 2, dim=1, keepdim=True).permute(0, 2, 1)
-                k = min(self.k, num_points - 1)
-                idx = pairwise_distance.topk(k=k + 1, dim=-1)[1][..., 1:]
-                idx_base = torch.arange(0, batch_size, device=x.device).view(-1, 1, 1) * num_points
-                idx = (idx + idx_base).view(-1)
-                x = x.permute(0, 2, 1).contiguous()
-                neighbors = x.view(batch_size * num_points, -1)[idx, :]
-                neighbors = neighbors.view(batch_size, num_points, k, num_dims)
-                x = x.view(batch_size, num_points, 1, num_dims).repeat(1, 1, k, 1)
-                return torch.cat((neighbors - x, x), dim=3).permute(0, 3, 1, 2)
-
-            def _classification(self, x):
-                x = torch.nn.functional.leaky_relu(self.fc1(x), negative_slope=0.2)
-                x = self.dropout(x)
-                x = torch.nn.functional.leaky_relu(self.fc2(x), negative_slope=0.2)
-                x = self.dropout(x)
-                return self.fc3(x)
-
-        self.model = DGCNN().to(self.device)
-        self.model.load_state_dict(torch.load(model_path, map_location=self.device))
-        self.model.eval()
-
-        self.colors = np.array([
-            [1, 0, 0],  # Classe 1 - Rouge
-            [0, 1, 0],  # Classe 2 - Vert
-            [0, 0, 1],  # Classe 3 - Bleu
-            [1, 1, 0],  # Classe 4 - Jaune
-        ])
-
-        self.class_names = ['Unclassified', 'Ground', 'Vegetation', 'Building']
-
-    def predict(self, file_path):
-        data = np.load(file_path)
-        assert data.shape[1] == 5, "Le fichier doit avoir exactement 5 colonnes"
-        points = torch.tensor(data, dtype=torch.float32).to(self.device)
-
-        predictions = []
-        batch_size = 128
-        with torch.no_grad():
-            for i in range(0, len(points), batch_size):
-                batch = points[i:i + batch_size]
-                pred = self.model(batch)
-                predictions.append(pred.argmax(dim=1).cpu().numpy())
-
-        class_ids = np.concatenate(predictions)
-        classified_data = np.column_stack((data, class_ids + 1))
-        return classified_data
-
-    def save_results(self, classified_data, original_path):
-        results_dir = os.path.join(settings.MEDIA_ROOT, 'classification_results')
+    def warmup(self):
+        """Passe avant à vide : allocations, noyaux et session ONNX prêts avant la première requête."""
+        self._classify(np.zeros((self.batch_size, 5), dtype=np.float32))
+
+    def save_results(self, classified_data, original_path, results_dir=None):
+        results_dir = results_dir or os.path.join(settings.MEDIA_ROOT, 'classification_results')
         os.makedirs(results_dir, exist_ok=True)
 
         base_name = os.path.basename(original_path).replace('.npy', '')
@@ -125,23 +38,8 @@ class DGCNNInference:
         np.save(result_path, classified_data)
 
         # Sauvegarde de la visualisation 2D
-        plt.figure(figsize=(10, 8))
-        scatter = plt.scatter(classified_data[:, 0], classified_data[:, 1],
-                              c=self.colors[classified_data[:, 5].astype(int) - 1],
-                              s=1)
-        legend_elements = [plt.Line2D([0], [0], marker='o', color='w',
-                                      markerfacecolor=self.colors[i],
-                                      markersize=8, label=self.class_names[i])
-                           for i in range(len(self.class_names))]
-        plt.legend(handles=legend_elements, loc='upper right')
-        plt.title("Classification Results - XY Projection")
-        plt.xlabel("X")
-        plt.ylabel("Y")
-        plt.axis('equal')
-
         img_path = os.path.join(results_dir, f'{base_name}_2d.png')
-        plt.savefig(img_path, dpi=300)
-        plt.close()
+        self._save_preview(classified_data[:, :2], classified_data[:, 5].astype(int), img_path)
 
         # Sauvegarde au format PLY
         pcd = o3d.geometry.PointCloud()
@@ -160,15 +58,105 @@ class DGCNNInference:
             'stats': self.get_stats(classified_data)
         }
 
+    def save_streaming_results(self, original_path, chunk_size=1_000_000, preview_points=1_000_000, results_dir=None):
+        """
+        Pendant de predict() + save_results() pour les gros nuages : classes
+        calculées par predict_streaming (entrée en memory-map, sortie écrite par
+        chunks), PLY écrit par chunks et aperçu 2D sur un sous-échantillon
+        régulier d'au plus preview_points points. Le fichier .npy téléchargeable
+        contient alors uniquement les classes (N,), alignées sur l'entrée.
+        """
+        results_dir = results_dir or os.path.join(settings.MEDIA_ROOT, 'classification_results')
+        os.makedirs(results_dir, exist_ok=True)
+
+        base_name = os.path.basename(original_path).replace('.npy', '')
+        result_path = os.path.join(results_dir, f'{base_name}_classes.npy')
+        classes = self.predict_streaming(original_path, result_path, chunk_size=chunk_size)
+        data = np.load(original_path, mmap_mode='r')
+
+        step = max(1, len(data) // preview_points)
+        preview = np.column_stack((data[::step, :2], classes[::step]))
+        img_path = os.path.join(results_dir, f'{base_name}_2d.png')
+        self._save_preview(preview[:, :2], preview[:, 2].astype(int), img_path)
+
+        ply_path = os.path.join(results_dir, f'{base_name}_classified.ply')
+        self._write_ply(ply_path, data, classes, chunk_size)
+
+        counts = self.class_counts(classes)
+        return {
+            'npy_path': result_path,
+            'img_path': img_path,
+            'ply_path': ply_path,
+            'base_name': base_name,
+            'stats': self._stats(np.flatnonzero(counts), counts[counts > 0], len(classes))
+        }
+
+    def _save_preview(self, xy, class_ids, img_path):
+        plt.figure(figsize=(10, 8))
+        plt.scatter(xy[:, 0], xy[:, 1], c=self.colors[class_ids - 1], s=1)
+        legend_elements = [plt.Line2D([0], [0], marker='o', color='w',
+                                      markerfacecolor=self.colors[i],
+                                      markersize=8, label=self.class_names[i])
+                           for i in range(len(self.class_names))]
+        plt.legend(handles=legend_elements, loc='upper right')
+        plt.title("Classification Results - XY Projection")
+        plt.xlabel("X")
+        plt.ylabel("Y")
+        plt.axis('equal')
+        plt.savefig(img_path, dpi=300)
+        plt.close()
+
+    def _write_ply(self, ply_path, data, classes, chunk_size):
+        """PLY binaire (x, y, z double + couleur RGB) écrit par chunks, sans charger le nuage."""
+        vertex = np.dtype([('x', '<f8'), ('y', '<f8'), ('z', '<f8'),
+                           ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+        colors = (self.colors * 255).astype(np.uint8)
+        with open(ply_path, 'wb') as f:
+            f.write((f"ply\nformat binary_little_endian 1.0\nelement vertex {len(data)}\n"
+                     "property double x\nproperty double y\nproperty double z\n"
+                     "property uchar red\nproperty uchar green\nproperty uchar blue\nend_header\n").encode('ascii'))
+            for start in range(0, len(data), chunk_size):
+                chunk = data[start:start + chunk_size]
+                rows = np.empty(len(chunk), dtype=vertex)
+                rows['x'], rows['y'], rows['z'] = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+                rgb = colors[classes[start:start + chunk_size].astype(int) - 1]
+                rows['red'], rows['green'], rows['blue'] = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+                rows.tofile(f)
+
     def get_stats(self, classified_data):
         unique, counts = np.unique(classified_data[:, 5], return_counts=True)
+        return self._stats(unique, counts, len(classified_data))
+
+    def _stats(self, unique, counts, total):
         stats = []
-        total = len(classified_data)
         for cls, count in zip(unique, counts):
             stats.append({
                 'class_id': int(cls),
                 'class_name': self.class_names[int(cls) - 1],
-                'count': count,
+                'count': int(count),
                 'percentage': f"{(count / total) * 100:.2f}%"
             })
-        return stats
\ No newline at end of file
+        return stats
+
+
+_inferencer = None
+_inferencer_lock = threading.Lock()
+
+
+def get_inferencer():
+    """
+    Modèle partagé par toutes les requêtes du processus : chargé et préchauffé
+    une seule fois (au démarrage si DGCNN_PRELOAD, sinon à la première
+    requête), le verrou évitant un double chargement entre threads.
+    """
+    global _inferencer
+    if _inferencer is None:
+        with _inferencer_lock:
+            if _inferencer is None:
+                start = time.perf_counter()
+                inferencer = DGCNNInference()
+                inferencer.warmup()
+                print(f"Modèle DGCNN chargé ({inferencer.backend}, batch {inferencer.batch_size}) "
+                      f"en {time.perf_counter() - start:.2f}s")
+                _inferencer = inferencer
+    return _inferencer
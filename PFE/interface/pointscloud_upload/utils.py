@@ -1,14 +1,145 @@
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import uuid
 from django.conf import settings
 
+
+def results_root():
+    return os.path.join(settings.MEDIA_ROOT, 'classification_results')
+
+
 def clean_old_files():
     """Nettoyer les fichiers de résultats anciens"""
-    results_dir = os.path.join(settings.MEDIA_ROOT, 'classification_results')
+    results_dir = results_root()
     if os.path.exists(results_dir):
         for filename in os.listdir(results_dir):
             file_path = os.path.join(results_dir, filename)
             try:
                 if os.path.isfile(file_path):
                     os.unlink(file_path)
+                elif os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
             except Exception as e:
-                print(f"Failed to delete {file_path}. Reason: {e}")
\ No newline at end of file
+                print(f"Failed to delete {file_path}. Reason: {e}")
+
+
+# Cache des résultats : un dossier par (contenu du nuage, poids du modèle) dans
+# classification_results/, avec meta.json (fichiers produits, statistiques).
+# La date de modification de meta.json sert de date de dernier accès (LRU).
+# Les dossiers commençant par '.' (en cours d'écriture ou d'éviction) sont ignorés.
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(uploaded_path, model_hash):
+    """Clé d'un résultat : SHA-256 du fichier uploadé + empreinte des poids ('backend:sha256')."""
+    return f"{file_hash(uploaded_path)[:32]}_{model_hash.replace(':', '-')}"
+
+
+def _entry_results(entry, meta):
+    results = {name: os.path.join(entry, filename) for name, filename in meta['files'].items()}
+    results.update(base_name=meta['base_name'], stats=meta['stats'])
+    return results
+
+
+def cached_results(key):
+    """Résultats (chemins, base_name, stats) déjà calculés pour cette clé, ou None."""
+    entry = os.path.join(results_root(), key)
+    meta_path = os.path.join(entry, 'meta.json')
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        os.utime(meta_path)
+    except FileNotFoundError:  # absent, ou évincé entre-temps
+        return None
+    results = _entry_results(entry, meta)
+    if not all(os.path.exists(results[name]) for name in meta['files']):
+        return None
+    return results
+
+
+def store_results(key, compute):
+    """
+    Calcule les résultats dans un dossier temporaire (compute(results_dir) ->
+    dict de save_results) puis le renomme en dossier de cache : une requête
+    concurrente sur le même nuage ne voit jamais d'entrée incomplète.
+    """
+    root = results_root()
+    os.makedirs(root, exist_ok=True)
+    # Nom unique par appel : deux threads du même processus ne partagent pas le dossier temporaire
+    tmp_dir = tempfile.mkdtemp(dir=root, prefix=f'.{key}.')
+    os.chmod(tmp_dir, 0o755)  # mkdtemp crée le dossier en 0700 : les fichiers media doivent rester lisibles
+    meta = None
+    try:
+        results = compute(tmp_dir)
+        meta = {
+            'files': {name: os.path.basename(path) for name, path in results.items() if name.endswith('_path')},
+            'base_name': results['base_name'],
+            'stats': results['stats'],
+        }
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        _publish(tmp_dir, os.path.join(root, key))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)  # calcul en échec, ou entrée déjà créée par une autre requête
+
+    evict(settings.DGCNN_RESULT_CACHE_MAX_BYTES, keep=key)
+    # Entrée évincée entre-temps par une autre requête : la classification terminée est servie quand même
+    results = cached_results(key)
+    if results is None and meta is not None:
+        results = _entry_results(os.path.join(root, key), meta)
+    return results
+
+
+def _publish(tmp_dir, entry):
+    """Renomme tmp_dir en entry, sauf si une autre requête a déjà publié cette entrée."""
+    for attempt in range(3):
+        try:
+            os.rename(tmp_dir, entry)
+            return
+        except OSError:
+            if os.path.isdir(entry):
+                return
+            if attempt == 2:
+                raise
+            # L'entrée existante a été évincée entre le rename et le test : nouvel essai
+
+
+def evict(max_bytes, keep=None):
+    """Supprime les entrées les moins récemment utilisées jusqu'à ce que le cache tienne dans max_bytes."""
+    root = results_root()
+    entries = []
+    for name in os.listdir(root):
+        if name.startswith('.'):
+            continue
+        entry = os.path.join(root, name)
+        try:
+            last_access = os.path.getmtime(os.path.join(entry, 'meta.json'))
+            size = sum(os.path.getsize(os.path.join(entry, filename)) for filename in os.listdir(entry))
+        except (FileNotFoundError, NotADirectoryError):  # entrée incomplète ou supprimée par une autre requête
+            continue
+        entries.append((last_access, size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        # Renommée d'abord en dossier caché : aucune requête ne voit une entrée à moitié supprimée
+        tombstone = os.path.join(root, f".{name}.{uuid.uuid4().hex}.evicted")
+        try:
+            os.rename(os.path.join(root, name), tombstone)
+        except FileNotFoundError:  # déjà évincée par une autre requête
+            total -= size
+            continue
+        shutil.rmtree(tombstone, ignore_errors=True)
+        total -= size
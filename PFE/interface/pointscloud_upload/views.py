@@ -1,9 +1,11 @@
 import os
+import numpy as np
 from django.shortcuts import render, redirect
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.http import JsonResponse, HttpResponse
-from .dgcnn_inference import DGCNNInference
+from .dgcnn_inference import get_inferencer
+from .utils import cache_key, cached_results, store_results
 
 
 def upload_page(request):
@@ -26,6 +28,18 @@ def upload_page(request):
     return render(request, 'pointscloud_upload/upload.html')
 
 
+def classify(inferencer, uploaded_path, results_dir):
+    num_points = len(np.load(uploaded_path, mmap_mode='r'))
+    if num_points >= settings.DGCNN_STREAMING_MIN_POINTS:
+        return inferencer.save_streaming_results(uploaded_path, results_dir=results_dir)
+    classified_data = inferencer.predict(uploaded_path)
+    return inferencer.save_results(classified_data, uploaded_path, results_dir=results_dir)
+
+
+def media_url(path):
+    return settings.MEDIA_URL + os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+
 def launch_classification(request):
     if 'uploaded_file_path' not in request.session:
         return redirect('upload_page')
@@ -34,9 +48,12 @@ def launch_classification(request):
     original_filename = request.session.get('original_filename', '')
 
     try:
-        inferencer = DGCNNInference()
-        classified_data = inferencer.predict(uploaded_path)
-        results = inferencer.save_results(classified_data, uploaded_path)
+        inferencer = get_inferencer()
+        # Même nuage et mêmes poids : résultats déjà calculés servis depuis le cache
+        key = cache_key(uploaded_path, inferencer.model_hash)
+        results = cached_results(key)
+        if results is None:
+            results = store_results(key, lambda results_dir: classify(inferencer, uploaded_path, results_dir))
 
         # Nettoyage
         if os.path.exists(uploaded_path):
@@ -46,12 +63,11 @@ def launch_classification(request):
         context = {
             'original_filename': original_filename,
             'results': results,
-            'img_url': os.path.join(settings.MEDIA_URL, 'classification_results',
-                                    f"{results['base_name']}_2d.png"),
-            'ply_url': os.path.join(settings.MEDIA_URL, 'classification_results',
-                                    f"{results['base_name']}_classified.ply"),
+            'img_url': media_url(results['img_path']),
+            'ply_url': media_url(results['ply_path']),
             'stats': results['stats']
         }
+        request.session['results'] = {name: path for name, path in results.items() if name.endswith('_path')}
 
         return render(request, 'pointscloud_upload/results.html', context)
 